@@ -1,3 +1,4 @@
+import os
 from logging.config import fileConfig
 
 from sqlalchemy import engine_from_config
@@ -5,6 +6,7 @@ from sqlalchemy import pool
 
 from alembic import context
 
+from app import config as app_config
 from app.models import Base
 
 # this is the Alembic Config object, which provides
@@ -16,6 +18,12 @@ config = context.config
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
+# URL из окружения (его задает docker-compose) имеет приоритет над alembic.ini;
+# драйвер в обоих случаях выбирает DATABASE_DRIVER, как у синхронного движка приложения
+url = app_config.DATABASE_URL if os.getenv("DATABASE_URL") else config.get_main_option("sqlalchemy.url")
+url = app_config.database_url(app_config.DATABASE_DRIVER, url).render_as_string(hide_password=False)
+config.set_main_option("sqlalchemy.url", url.replace("%", "%%"))
+
 # add your model's MetaData object here
 # for 'autogenerate' support
 # from myapp import mymodel
@@ -0,0 +1,35 @@
+"""Add organization name trigram index
+
+Revision ID: 22a3eefeb798
+Revises: 9e57de6dad72
+Create Date: 2026-10-18 13:17:40.093409
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '22a3eefeb798'
+down_revision: Union[str, None] = '9e57de6dad72'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # GIN-индекс по триграммам обслуживает ILIKE '%...%' и оператор похожести %
+    op.create_index('ix_organizations_name_trgm', 'organizations', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    # B-tree по lower(name) для поиска по префиксу (typeahead) любой длины
+    op.create_index('ix_organizations_name_lower_prefix', 'organizations', [sa.text('lower(name) text_pattern_ops')],
+                    unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_organizations_name_lower_prefix', table_name='organizations')
+    op.drop_index('ix_organizations_name_trgm', table_name='organizations')
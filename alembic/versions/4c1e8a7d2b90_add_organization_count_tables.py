@@ -0,0 +1,66 @@
+"""Add organization count tables
+
+Revision ID: 4c1e8a7d2b90
+Revises: 9b2ab4ae1fd5
+Create Date: 2026-10-18 14:02:11.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c1e8a7d2b90'
+down_revision: Union[str, None] = '9b2ab4ae1fd5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('activity_organization_counts',
+    sa.Column('activity_id', sa.Integer(), nullable=False),
+    sa.Column('organizations', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['activity_id'], ['activities.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('activity_id')
+    )
+    op.create_table('tile_counts',
+    sa.Column('zoom', sa.Integer(), nullable=False),
+    sa.Column('x', sa.Integer(), nullable=False),
+    sa.Column('y', sa.Integer(), nullable=False),
+    sa.Column('organizations', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('zoom', 'x', 'y')
+    )
+
+    # Заполняем счетчики по уже существующим данным. SQL скопирован сюда, а не импортируется из app.aggregates:
+    # миграция должна выполнять то же самое и после изменений в коде приложения
+    op.execute("""
+        INSERT INTO activity_organization_counts (activity_id, organizations)
+        SELECT c.ancestor_id, count(DISTINCT l.organization_id)
+        FROM organization_activity l JOIN activity_closure c ON c.descendant_id = l.activity_id
+        GROUP BY c.ancestor_id
+    """)
+    # Тайлы Web Mercator уровня 18 для каждого здания с организациями, уровни 0..17 — сдвигом
+    op.execute("""
+        INSERT INTO tile_counts (zoom, x, y, organizations)
+        SELECT z.zoom, p.x >> (18 - z.zoom), p.y >> (18 - z.zoom), sum(p.organizations)
+        FROM (
+            SELECT least(greatest(floor((b.longitude + 180) / 360 * 262144), 0), 262143)::integer AS x,
+                   least(greatest(floor((1 - asinh(tan(radians(least(greatest(b.latitude, -85.0511287798),
+                                                                       85.0511287798)))) / pi()) / 2 * 262144),
+                                  0), 262143)::integer AS y,
+                   count(*) AS organizations
+            FROM organizations o JOIN buildings b ON b.id = o.building_id
+            GROUP BY b.id
+        ) p
+        CROSS JOIN generate_series(0, 18) AS z(zoom)
+        GROUP BY 1, 2, 3
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('tile_counts')
+    op.drop_table('activity_organization_counts')
@@ -0,0 +1,28 @@
+"""Add buildings coordinates index
+
+Revision ID: 6f2760351c0b
+Revises: bf1e56601dbf
+Create Date: 2026-10-18 13:07:27.266053
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6f2760351c0b'
+down_revision: Union[str, None] = 'bf1e56601dbf'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_buildings_latitude_longitude', 'buildings', ['latitude', 'longitude'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_buildings_latitude_longitude', table_name='buildings')
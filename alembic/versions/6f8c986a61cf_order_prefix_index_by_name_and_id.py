@@ -0,0 +1,35 @@
+"""Order prefix index by name and id
+
+Revision ID: 6f8c986a61cf
+Revises: 7a3f5c9e1d24
+Create Date: 2026-10-18 16:05:12.448310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6f8c986a61cf'
+down_revision: Union[str, None] = '7a3f5c9e1d24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Поиск по префиксу сортирует по (lower(name), id). С побайтовым сравнением (COLLATE "C") B-tree
+    # с обычным классом операторов обслуживает и LIKE 'префикс%', и этот порядок: первые limit строк
+    # читаются из индекса без сортировки всех совпадений
+    op.drop_index('ix_organizations_name_lower_prefix', table_name='organizations')
+    op.create_index('ix_organizations_name_lower_prefix', 'organizations',
+                    [sa.text('(lower(name) COLLATE "C")'), 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_organizations_name_lower_prefix', table_name='organizations')
+    op.create_index('ix_organizations_name_lower_prefix', 'organizations', [sa.text('lower(name) text_pattern_ops')],
+                    unique=False)
@@ -0,0 +1,53 @@
+"""Add building tiles table
+
+Revision ID: 7a3f5c9e1d24
+Revises: 4c1e8a7d2b90
+Create Date: 2026-10-18 14:41:37.902156
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a3f5c9e1d24'
+down_revision: Union[str, None] = '4c1e8a7d2b90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('building_tiles',
+    sa.Column('zoom', sa.Integer(), nullable=False),
+    sa.Column('x', sa.Integer(), nullable=False),
+    sa.Column('y', sa.Integer(), nullable=False),
+    sa.Column('buildings', sa.Integer(), nullable=False),
+    sa.Column('latitude_sum', sa.Float(), nullable=False),
+    sa.Column('longitude_sum', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('zoom', 'x', 'y')
+    )
+
+    # Заполняем тайлы по уже существующим зданиям: тайл Web Mercator уровня 18, уровни 0..17 — сдвигом.
+    # SQL скопирован сюда, а не импортируется из app.aggregates, чтобы миграция не менялась вместе с приложением
+    op.execute("""
+        INSERT INTO building_tiles (zoom, x, y, buildings, latitude_sum, longitude_sum)
+        SELECT z.zoom, p.x >> (18 - z.zoom), p.y >> (18 - z.zoom), count(*), sum(p.latitude), sum(p.longitude)
+        FROM (
+            SELECT least(greatest(floor((b.longitude + 180) / 360 * 262144), 0), 262143)::integer AS x,
+                   least(greatest(floor((1 - asinh(tan(radians(least(greatest(b.latitude, -85.0511287798),
+                                                                       85.0511287798)))) / pi()) / 2 * 262144),
+                                  0), 262143)::integer AS y,
+                   b.latitude, b.longitude
+            FROM buildings b
+        ) p
+        CROSS JOIN generate_series(0, 18) AS z(zoom)
+        GROUP BY 1, 2, 3
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('building_tiles')
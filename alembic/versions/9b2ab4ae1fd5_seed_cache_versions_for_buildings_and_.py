@@ -0,0 +1,29 @@
+"""Seed cache versions for buildings and organizations
+
+Revision ID: 9b2ab4ae1fd5
+Revises: 22a3eefeb798
+Create Date: 2026-10-18 13:30:21.068631
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b2ab4ae1fd5'
+down_revision: Union[str, None] = '22a3eefeb798'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    cache_versions_table = sa.table('cache_versions', sa.column('name', sa.String()), sa.column('version', sa.Integer()))
+    op.bulk_insert(cache_versions_table, [{"name": "buildings", "version": 0}, {"name": "organizations", "version": 0}])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DELETE FROM cache_versions WHERE name IN ('buildings', 'organizations')")
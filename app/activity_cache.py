@@ -0,0 +1,83 @@
+import time
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import config
+from app.cache_versions import get_version
+from app.models import Activity
+
+CACHE_NAME = "activities"
+
+
+class ActivityTree:
+    """Неизменяемый снимок дерева деятельностей с предвычисленными глубинами и множествами потомков."""
+
+    def __init__(self, parents: dict[int, Optional[int]], version: int):
+        self.version = version
+        self.loaded_at = time.time()
+        self.parents = parents
+        self.children: dict[int, list[int]] = {activity_id: [] for activity_id in parents}
+        for activity_id, parent_id in parents.items():
+            if parent_id in self.children:
+                self.children[parent_id].append(activity_id)
+
+        self.depth: dict[int, int] = {}
+        self.descendants: dict[int, frozenset[int]] = {}
+        roots = [activity_id for activity_id, parent_id in parents.items() if parent_id not in parents]
+        for root in roots:
+            self._walk(root)
+
+    def _walk(self, root: int):
+        # Обход в глубину без рекурсии: сначала глубины сверху вниз, затем потомки снизу вверх
+        order = []
+        stack = [(root, 0)]
+        while stack:
+            activity_id, depth = stack.pop()
+            if activity_id in self.depth:
+                continue
+            self.depth[activity_id] = depth
+            order.append(activity_id)
+            stack.extend((child, depth + 1) for child in self.children[activity_id])
+        for activity_id in reversed(order):
+            subtree = {activity_id}
+            for child in self.children[activity_id]:
+                subtree |= self.descendants.get(child, frozenset())
+            self.descendants[activity_id] = frozenset(subtree)
+
+    def subtree(self, activity_id: int) -> frozenset[int]:
+        return self.descendants.get(activity_id, frozenset())
+
+
+class ActivityCache:
+    """
+    Кэш дерева деятельностей в памяти процесса.
+
+    Загружается лениво и сбрасывается в create_activity / delete_activity. Записи из других воркеров
+    обнаруживаются по версии в таблице cache_versions, которая сверяется не чаще раза в check_interval секунд.
+    """
+
+    def __init__(self, check_interval: float):
+        self.check_interval = check_interval
+        self._tree: Optional[ActivityTree] = None
+        self._checked_at = 0.0
+
+    async def get(self, db: AsyncSession) -> ActivityTree:
+        tree = self._tree
+        now = time.monotonic()
+        if tree is not None and now - self._checked_at < self.check_interval:
+            return tree
+        version = await get_version(db, CACHE_NAME)
+        if tree is None or tree.version != version:
+            # Снимок подменяется целиком, поэтому параллельные запросы видят либо старое, либо новое дерево
+            rows = (await db.execute(select(Activity.id, Activity.parent_id))).all()
+            tree = self._tree = ActivityTree({row.id: row.parent_id for row in rows}, version)
+        self._checked_at = now
+        return tree
+
+    def invalidate(self):
+        self._tree = None
+
+
+activity_cache = ActivityCache(check_interval=config.ACTIVITY_CACHE_CHECK_INTERVAL)
@@ -0,0 +1,229 @@
+"""
+Счетчики для агрегатных запросов (/stats/...) и кластеров карты (/tiles/...).
+
+activity_organization_counts, tile_counts и building_tiles меняются в той же транзакции, что и данные:
+создание и удаление организации сдвигает на ±1 счетчики её деятельностей вместе с предками и тайлов
+её здания на всех уровнях, создание, перенос и удаление здания — тайлы здания. Поэтому чтение — выборка
+по первичному ключу, без обхода organization_activity и buildings. Загрузчик (app.loader) и миграции
+пересчитывают таблицы целиком одной командой SQL на таблицу (TILE_COUNTS_REBUILD и т. п., только PostgreSQL),
+генератор тестовых данных для SQLite — функцией rebuild.
+"""
+from collections import Counter
+from typing import Iterable
+
+from sqlalchemy import Column, Connection, Table, delete, func, insert, select, text, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.geo import MAX_MERCATOR_LATITUDE, tile
+from app.models import Building, Organization, activity_closure, activity_organization_counts, building_tiles, \
+    organization_activity, tile_counts
+
+# Самый подробный уровень тайлов со счетчиками (тайл около 150 м); менять вместе с пересчетом tile_counts
+# и building_tiles
+TILE_MAX_ZOOM = 18
+
+# Полный пересчет счетчиков деятельностей; работает и в PostgreSQL, и в SQLite
+ACTIVITY_COUNTS_REBUILD = (
+    "DELETE FROM activity_organization_counts",
+    """
+    INSERT INTO activity_organization_counts (activity_id, organizations)
+    SELECT c.ancestor_id, count(DISTINCT l.organization_id)
+    FROM organization_activity l JOIN activity_closure c ON c.descendant_id = l.activity_id
+    GROUP BY c.ancestor_id
+    """,
+)
+# Тайл (x, y) уровня TILE_MAX_ZOOM здания b в SQL (PostgreSQL): та же формула, что в app.geo.tile
+_TILES = 1 << TILE_MAX_ZOOM
+TILE_X = f"least(greatest(floor((b.longitude + 180) / 360 * {_TILES}), 0), {_TILES - 1})::integer"
+TILE_Y = f"least(greatest(floor((1 - asinh(tan(radians(least(greatest(b.latitude, {-MAX_MERCATOR_LATITUDE}), " \
+         f"{MAX_MERCATOR_LATITUDE})))) / pi()) / 2 * {_TILES}), 0), {_TILES - 1})::integer"
+# Полный пересчет tile_counts и building_tiles в PostgreSQL: тайлы всех уровней получаются из тайла
+# уровня TILE_MAX_ZOOM сдвигом (см. tiles), суммирование идет в базе без выборки строк в приложение
+TILE_COUNTS_REBUILD = (
+    "DELETE FROM tile_counts",
+    f"""
+    INSERT INTO tile_counts (zoom, x, y, organizations)
+    SELECT z.zoom, p.x >> ({TILE_MAX_ZOOM} - z.zoom), p.y >> ({TILE_MAX_ZOOM} - z.zoom), sum(p.organizations)
+    FROM (SELECT {TILE_X} AS x, {TILE_Y} AS y, count(*) AS organizations
+          FROM organizations o JOIN buildings b ON b.id = o.building_id
+          GROUP BY b.id) p
+    CROSS JOIN generate_series(0, {TILE_MAX_ZOOM}) AS z(zoom)
+    GROUP BY 1, 2, 3
+    """,
+)
+BUILDING_TILES_REBUILD = (
+    "DELETE FROM building_tiles",
+    f"""
+    INSERT INTO building_tiles (zoom, x, y, buildings, latitude_sum, longitude_sum)
+    SELECT z.zoom, p.x >> ({TILE_MAX_ZOOM} - z.zoom), p.y >> ({TILE_MAX_ZOOM} - z.zoom),
+           count(*), sum(p.latitude), sum(p.longitude)
+    FROM (SELECT {TILE_X} AS x, {TILE_Y} AS y, b.latitude, b.longitude FROM buildings b) p
+    CROSS JOIN generate_series(0, {TILE_MAX_ZOOM}) AS z(zoom)
+    GROUP BY 1, 2, 3
+    """,
+)
+# Здания с организациями для полного пересчета tile_counts: (широта, долгота, число организаций)
+TILE_POINTS = """
+    SELECT b.latitude, b.longitude, count(*)
+    FROM organizations o JOIN buildings b ON b.id = o.building_id
+    GROUP BY b.id, b.latitude, b.longitude
+"""
+# Все здания для полного пересчета building_tiles: (широта, долгота)
+BUILDING_POINTS = "SELECT latitude, longitude FROM buildings"
+
+
+def tiles(lat: float, lon: float) -> list[tuple[int, int, int]]:
+    """Тайлы (zoom, x, y) всех уровней 0..TILE_MAX_ZOOM, в которые попадает точка."""
+    # Тайл уровня zoom - 1 делится на 2x2 тайла уровня zoom, поэтому крупные уровни получаются сдвигом
+    x, y = tile(lat, lon, TILE_MAX_ZOOM)
+    return [(zoom, x >> (TILE_MAX_ZOOM - zoom), y >> (TILE_MAX_ZOOM - zoom)) for zoom in range(TILE_MAX_ZOOM + 1)]
+
+
+def count_tiles(points: Iterable[tuple[float, float, int]]) -> Counter:
+    """Число организаций по тайлам для точек (широта, долгота, число организаций в точке)."""
+    counts = Counter()
+    for lat, lon, organizations in points:
+        if organizations:
+            for key in tiles(lat, lon):
+                counts[key] += organizations
+    return counts
+
+
+def sum_tiles(points: Iterable[tuple[float, ...]]) -> dict[tuple[int, int, int], list]:
+    """Число зданий и суммы их координат [зданий, сумма широт, сумма долгот] по тайлам для точек (широта, долгота)."""
+    sums = {}
+    for lat, lon, *_ in points:
+        for key in tiles(lat, lon):
+            tile_sums = sums.get(key)
+            if tile_sums is None:
+                sums[key] = [1, lat, lon]
+            else:
+                tile_sums[0] += 1
+                tile_sums[1] += lat
+                tile_sums[2] += lon
+    return sums
+
+
+def tile_count_rows(counts: Counter, sign: int = 1) -> list[dict]:
+    return [{"zoom": zoom, "x": x, "y": y, "organizations": sign * count}
+            for (zoom, x, y), count in sorted(counts.items())]
+
+
+def building_tile_rows(sums: dict, sign: int = 1) -> list[dict]:
+    return [{"zoom": zoom, "x": x, "y": y, "buildings": sign * count,
+             "latitude_sum": sign * latitude_sum, "longitude_sum": sign * longitude_sum}
+            for (zoom, x, y), (count, latitude_sum, longitude_sum) in sorted(sums.items())]
+
+
+def _upsert(db: AsyncSession, table: Table):
+    # INSERT, прибавляющий значения к существующим счетчикам (ON CONFLICT DO UPDATE)
+    dialect = sqlite if db.get_bind().dialect.name == "sqlite" else postgresql
+    statement = dialect.insert(table)
+    return statement.on_conflict_do_update(
+        index_elements=list(table.primary_key.columns),
+        set_={column.name: column + statement.excluded[column.name]
+              for column in table.columns if not column.primary_key})
+
+
+async def _count_activities(db: AsyncSession, organization_ids: list[int], sign: int):
+    # Одна команда INSERT ... SELECT; строки идут по возрастанию ключа, чтобы параллельные транзакции
+    # блокировали счетчики в одном порядке
+    closure, links = activity_closure.c, organization_activity.c
+    await db.execute(_upsert(db, activity_organization_counts).from_select(
+        ["activity_id", "organizations"],
+        select(closure.ancestor_id, func.count(links.organization_id.distinct()) * sign)
+        .select_from(organization_activity)
+        .join(activity_closure, closure.descendant_id == links.activity_id)
+        .where(links.organization_id.in_(organization_ids))
+        .group_by(closure.ancestor_id)
+        .order_by(closure.ancestor_id)
+    ))
+
+
+async def _add_tiles(db: AsyncSession, table: Table, counter: Column, rows: list[dict]):
+    # Строки отсортированы по ключу (см. _count_activities); тайлы, где счетчик дошел до нуля, удаляются
+    if not rows:
+        return
+    # RETURNING — одна многострочная команда VALUES вместо INSERT на каждую строку (см. app.bulk.insert_rows)
+    await db.execute(_upsert(db, table).returning(*table.primary_key.columns), rows)
+    if rows[0][counter.name] < 0:
+        columns = table.c
+        await db.execute(delete(table).where(counter <= 0, tuple_(columns.zoom, columns.x, columns.y).in_(
+            [(row["zoom"], row["x"], row["y"]) for row in rows])))
+
+
+async def count_organizations(db: AsyncSession, organization_ids: list[int], sign: int):
+    """
+    Учитывает организации в счетчиках: sign=1 после вставки организаций и их связей,
+    sign=-1 перед удалением, пока связи и здание еще на месте.
+    """
+    if not organization_ids:
+        return
+    await _count_activities(db, organization_ids, sign)
+    points = (await db.execute(
+        select(Building.latitude, Building.longitude, func.count(Organization.id))
+        .join(Organization, Organization.building_id == Building.id)
+        .where(Organization.id.in_(organization_ids))
+        .group_by(Building.id, Building.latitude, Building.longitude)
+    )).all()
+    await _add_tiles(db, tile_counts, tile_counts.c.organizations, tile_count_rows(count_tiles(points), sign))
+
+
+async def count_buildings(db: AsyncSession, condition, sign: int):
+    """
+    Учитывает в счетчиках тайлов здания, подходящие под condition, вместе с их организациями:
+    sign=1 после вставки или переноса, sign=-1 перед переносом или удалением.
+    """
+    points = (await db.execute(
+        select(Building.latitude, Building.longitude, func.count(Organization.id))
+        .outerjoin(Organization, Organization.building_id == Building.id)
+        .where(condition)
+        .group_by(Building.id, Building.latitude, Building.longitude)
+    )).all()
+    await _add_tiles(db, building_tiles, building_tiles.c.buildings, building_tile_rows(sum_tiles(points), sign))
+    await _add_tiles(db, tile_counts, tile_counts.c.organizations, tile_count_rows(count_tiles(points), sign))
+
+
+async def recount_activities(db: AsyncSession, activity_ids: list[int]):
+    """Пересчитывает счетчики деятельностей activity_ids заново (после изменения дерева)."""
+    closure, links = activity_closure.c, organization_activity.c
+    await db.execute(delete(activity_organization_counts)
+                     .where(activity_organization_counts.c.activity_id.in_(activity_ids)))
+    await db.execute(insert(activity_organization_counts).from_select(
+        ["activity_id", "organizations"],
+        select(closure.ancestor_id, func.count(links.organization_id.distinct()))
+        .select_from(organization_activity)
+        .join(activity_closure, closure.descendant_id == links.activity_id)
+        .where(closure.ancestor_id.in_(activity_ids))
+        .group_by(closure.ancestor_id)
+    ))
+
+
+def rebuild_activity_counts(conn: Connection):
+    for statement in ACTIVITY_COUNTS_REBUILD:
+        conn.execute(text(statement))
+
+
+def rebuild_tile_counts(conn: Connection):
+    conn.execute(delete(tile_counts))
+    rows = tile_count_rows(count_tiles(conn.execute(text(TILE_POINTS)).all()))
+    if rows:
+        conn.execute(insert(tile_counts), rows)
+
+
+def rebuild_building_tiles(conn: Connection):
+    conn.execute(delete(building_tiles))
+    rows = building_tile_rows(sum_tiles(conn.execute(text(BUILDING_POINTS)).all()))
+    if rows:
+        conn.execute(insert(building_tiles), rows)
+
+
+def rebuild(conn: Connection):
+    """
+    Пересчитывает все таблицы счетчиков по текущим данным (синхронное соединение). Тайлы считаются
+    в Python, поэтому работает и в SQLite; в PostgreSQL быстрее TILE_COUNTS_REBUILD и BUILDING_TILES_REBUILD.
+    """
+    rebuild_activity_counts(conn)
+    rebuild_tile_counts(conn)
+    rebuild_building_tiles(conn)
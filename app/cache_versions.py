@@ -0,0 +1,32 @@
+from typing import Iterable
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import cache_versions
+
+
+async def get_version(db: AsyncSession, name: str) -> int:
+    version = (await db.execute(select(cache_versions.c.version).where(cache_versions.c.name == name))).scalar()
+    return version or 0
+
+
+async def get_versions(db: AsyncSession, names: Iterable[str]) -> dict[str, int]:
+    names = list(names)
+    rows = (await db.execute(
+        select(cache_versions.c.name, cache_versions.c.version).where(cache_versions.c.name.in_(names))
+    )).all()
+    versions = dict.fromkeys(names, 0)
+    versions.update({row.name: row.version for row in rows})
+    return versions
+
+
+async def bump_version(db: AsyncSession, name: str) -> int:
+    version = (await db.execute(
+        update(cache_versions).where(cache_versions.c.name == name).values(version=cache_versions.c.version + 1)
+        .returning(cache_versions.c.version)
+    )).scalar()
+    if version is None:
+        version = 1
+        await db.execute(insert(cache_versions).values(name=name, version=version))
+    return version
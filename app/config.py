@@ -0,0 +1,72 @@
+import os
+
+from sqlalchemy.engine import URL, make_url
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Подключение к базе; docker-compose передает DATABASE_URL в контейнер api
+DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://postgres:123@db/organizations")
+# Реплика для чтения; если не задана, GET-запросы идут в основную базу
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+# Сколько секунд после записи клиент читает из основной базы, чтобы видеть свои изменения несмотря на лаг реплики
+READ_YOUR_WRITES_WINDOW = int(os.getenv("READ_YOUR_WRITES_WINDOW", "5"))
+# Драйвер синхронного движка (Alembic, скрипты): psycopg2 или psycopg; асинхронный движок всегда на psycopg 3
+DATABASE_DRIVER = os.getenv("DATABASE_DRIVER", "psycopg2")
+
+
+def database_url(driver: str, url: str = DATABASE_URL) -> URL:
+    """Строка подключения url с драйвером driver (psycopg2 или psycopg) вместо указанного в ней."""
+    return make_url(url).set(drivername=f"postgresql+{driver}")
+
+
+# Размер пула на каждый процесс: воркеры * (DB_POOL_SIZE + DB_MAX_OVERFLOW) не должно превышать max_connections
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Сколько секунд ждать свободного соединения, прежде чем вернуть ошибку
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Проверять соединение перед выдачей из пула (переживает перезапуск базы ценой одного round-trip)
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", False)
+# Через сколько секунд пересоздавать соединение; -1 — не пересоздавать
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "-1"))
+# statement_timeout в миллисекундах для каждого соединения; 0 — без ограничения
+DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", "0"))
+# Работа через PgBouncer в режиме transaction: без собственного пула и без подготовленных выражений
+DB_PGBOUNCER = _env_bool("DB_PGBOUNCER", False)
+
+# Кэш координат зданий в памяти процесса для запросов by-area
+SPATIAL_INDEX_ENABLED = _env_bool("SPATIAL_INDEX_ENABLED", False)
+# Размер ячейки сетки в градусах (0.01° ≈ 1.1 км по широте)
+SPATIAL_INDEX_CELL_SIZE = float(os.getenv("SPATIAL_INDEX_CELL_SIZE", "0.01"))
+# Как часто (в секундах) сверять версию зданий с базой, чтобы подхватить изменения из других воркеров;
+# 0 — при каждом обращении
+SPATIAL_INDEX_CHECK_INTERVAL = float(os.getenv("SPATIAL_INDEX_CHECK_INTERVAL", "0"))
+# Сколько зданий индекс отдает списком; при большем числе фильтр по координатам выполняется в SQL
+SPATIAL_INDEX_MAX_IDS = int(os.getenv("SPATIAL_INDEX_MAX_IDS", "1000"))
+
+# Кэш дерева деятельностей в памяти процесса
+ACTIVITY_CACHE_ENABLED = _env_bool("ACTIVITY_CACHE_ENABLED", True)
+# Как часто (в секундах) сверять версию кэша с базой; 0 — при каждом обращении
+ACTIVITY_CACHE_CHECK_INTERVAL = float(os.getenv("ACTIVITY_CACHE_CHECK_INTERVAL", "0"))
+
+# Кэш ответов GET-запросов с ETag (/buildings/, /activities/, организации по зданию и дереву деятельностей, тайлы)
+RESPONSE_CACHE_ENABLED = _env_bool("RESPONSE_CACHE_ENABLED", True)
+# memory — LRU в памяти процесса, redis — общий кэш по RESPONSE_CACHE_REDIS_URL (нужен пакет redis)
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")
+RESPONSE_CACHE_REDIS_URL = os.getenv("RESPONSE_CACHE_REDIS_URL", "redis://localhost:6379/0")
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "300"))
+
+# Сжатие ответов больше RESPONSE_COMPRESSION_MIN_SIZE байт: br (если установлен пакет brotli) или gzip
+RESPONSE_COMPRESSION_ENABLED = _env_bool("RESPONSE_COMPRESSION_ENABLED", True)
+RESPONSE_COMPRESSION_MIN_SIZE = int(os.getenv("RESPONSE_COMPRESSION_MIN_SIZE", "1024"))
+
+# Метрики запросов (/metrics, заголовок Server-Timing)
+METRICS_ENABLED = _env_bool("METRICS_ENABLED", True)
+# Больше SQL-запросов на один HTTP-запрос — предупреждение в лог (признак N+1)
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", "10"))
@@ -1,15 +1,80 @@
-from sqlalchemy import create_engine
+from fastapi import Request, Response
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
-DATABASE_URL = "postgresql://postgres:123@db/organizations"
+from app import config
+from app.metrics import instrument
 
-engine = create_engine(DATABASE_URL)
+DATABASE_URL = config.database_url(config.DATABASE_DRIVER)
+# psycopg 3 (уже в зависимостях) работает и в асинхронном режиме
+ASYNC_DATABASE_URL = config.database_url("psycopg")
+
+
+def engine_options(driver: str) -> dict:
+    connect_args = {}
+    if config.DB_PGBOUNCER:
+        # PgBouncer в режиме transaction отдает соединения разным клиентам между транзакциями:
+        # свой пул не нужен, а подготовленные выражения psycopg 3 окажутся на чужом соединении.
+        # Параметр options PgBouncer не принимает, statement_timeout задается через ALTER ROLE
+        if driver == "psycopg":
+            connect_args["prepare_threshold"] = None
+        return {"poolclass": NullPool, "connect_args": connect_args}
+
+    if config.DB_STATEMENT_TIMEOUT:
+        connect_args["options"] = f"-c statement_timeout={config.DB_STATEMENT_TIMEOUT}"
+    return {
+        "pool_size": config.DB_POOL_SIZE,
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "pool_timeout": config.DB_POOL_TIMEOUT,
+        "pool_pre_ping": config.DB_POOL_PRE_PING,
+        "pool_recycle": config.DB_POOL_RECYCLE,
+        "connect_args": connect_args,
+    }
+
+
+# Синхронный движок остается для Alembic и служебных скриптов
+engine = create_engine(DATABASE_URL, **engine_options(config.DATABASE_DRIVER))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options("psycopg"))
+# expire_on_commit=False: после commit объекты не перечитываются лениво, что невозможно в асинхронном режиме
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+if config.METRICS_ENABLED:
+    instrument(async_engine.sync_engine)
+
+
+if config.DATABASE_REPLICA_URL:
+    replica_engine = create_async_engine(
+        make_url(config.DATABASE_REPLICA_URL).set(drivername="postgresql+psycopg"), **engine_options("psycopg"))
+    ReadSessionLocal = async_sessionmaker(replica_engine, autoflush=False, expire_on_commit=False)
+    if config.METRICS_ENABLED:
+        instrument(replica_engine.sync_engine)
+else:
+    ReadSessionLocal = AsyncSessionLocal
+
+# Cookie, по которой клиент после записи какое-то время читает из основной базы
+PRIMARY_COOKIE = "read_primary"
+
+
+def read_sessionmaker(request: Request) -> async_sessionmaker:
+    if request.cookies.get(PRIMARY_COOKIE):
+        return AsyncSessionLocal
+    return ReadSessionLocal
+
+
+async def get_db(response: Response):
+    # Сессия основной базы — для записи. Cookie read-your-writes клиент получает только после commit:
+    # запросы, которые ничего не записали (ошибка или пачка из одних ошибок), не уводят его чтение с реплики
+    async with AsyncSessionLocal() as db:
+        if ReadSessionLocal is not AsyncSessionLocal and config.READ_YOUR_WRITES_WINDOW > 0:
+            event.listen(db.sync_session, "after_commit", lambda session: response.set_cookie(
+                PRIMARY_COOKIE, "1", max_age=config.READ_YOUR_WRITES_WINDOW, httponly=True))
+        yield db
+
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_read_db(request: Request):
+    async with read_sessionmaker(request)() as db:
         yield db
-    finally:
-        db.close()
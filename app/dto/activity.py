@@ -1,11 +1,30 @@
-from typing import Optional
+from typing import Iterable, Optional
 
 from fastapi import HTTPException
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models import Activity as ActivitySQL
+from app import config
+from app.activity_cache import activity_cache
+from app.models import activity_closure
 
+MAX_ACTIVITY_LEVEL = 3
+
+
+async def activity_depths(db: AsyncSession, activity_ids: Iterable[int]) -> dict[int, int]:
+    # Глубина деятельности — самое длинное расстояние до её предков (у корня 0); несуществующих ID в ответе нет
+    activity_ids = set(activity_ids)
+    if config.ACTIVITY_CACHE_ENABLED:
+        depth = (await activity_cache.get(db)).depth
+        return {activity_id: depth[activity_id] for activity_id in activity_ids if activity_id in depth}
+    closure = activity_closure.c
+    rows = (await db.execute(
+        select(closure.descendant_id, func.max(closure.depth))
+        .where(closure.descendant_id.in_(activity_ids))
+        .group_by(closure.descendant_id)
+    )).all()
+    return {activity_id: depth for activity_id, depth in rows}
 
 
 class Activity(BaseModel):
@@ -22,11 +41,9 @@ class ActivityCreate(BaseModel):
     parent_id: Optional[int] = None
 
     @staticmethod
-    def validate_parent_level(db: Session, parent_id: Optional[int]):
-        level = 0
-        current_parent = db.query(ActivitySQL).filter(ActivitySQL.id == parent_id).first()
-        while current_parent:
-            level += 1
-            if level >= 3:
-                raise HTTPException(status_code=404, detail=f"The maximum level of nesting of activities is 3 levels")
-            current_parent = db.query(ActivitySQL).filter(ActivitySQL.id == current_parent.parent_id).first()
+    async def validate_parent_level(db: AsyncSession, parent_id: Optional[int]):
+        parent_depth = (await activity_depths(db, [parent_id])).get(parent_id)
+        if parent_depth is None:
+            raise HTTPException(status_code=404, detail=f"Parent activity with ID {parent_id} does not exist")
+        if parent_depth + 1 >= MAX_ACTIVITY_LEVEL:
+            raise HTTPException(status_code=404, detail=f"The maximum level of nesting of activities is 3 levels")
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseModel
 
 
@@ -11,6 +13,10 @@ class Building(BaseModel):
         from_attributes = True
 
 
+class BuildingWithDistance(Building):
+    distance: Optional[float] = None
+
+
 class BuildingCreate(BaseModel):
     address: str
     latitude: float
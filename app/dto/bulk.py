@@ -0,0 +1,17 @@
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+# Максимум записей в одном запросе bulk-загрузки
+MAX_BULK_SIZE = 10000
+
+
+class BulkError(BaseModel):
+    index: int
+    detail: str
+
+
+class BulkResult(BaseModel):
+    # ID для каждой переданной записи в том же порядке; None — запись не сохранена, причина в errors
+    ids: List[Optional[int]]
+    errors: List[BulkError]
@@ -17,6 +17,10 @@ class Organization(BaseModel):
         from_attributes = True
 
 
+class OrganizationWithDistance(Organization):
+    distance: Optional[float] = None
+
+
 class OrganizationCreate(BaseModel):
     name: str
     phone_numbers: Optional[str] = None
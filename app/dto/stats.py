@@ -0,0 +1,19 @@
+from pydantic import BaseModel
+
+
+class ActivityCount(BaseModel):
+    activity_id: int
+    organizations: int
+
+    class Config:
+        from_attributes = True
+
+
+class TileCount(BaseModel):
+    zoom: int
+    x: int
+    y: int
+    organizations: int
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,28 @@
+from pydantic import BaseModel
+
+from app.dto.building import Building
+
+
+class TileCluster(BaseModel):
+    latitude: float
+    longitude: float
+    buildings: int
+    organizations: int
+
+    class Config:
+        from_attributes = True
+
+
+class TileBuilding(Building):
+    organizations: int
+
+
+class Tile(BaseModel):
+    zoom: int
+    x: int
+    y: int
+    clusters: list[TileCluster]
+    buildings: list[TileBuilding]
+
+    class Config:
+        from_attributes = True
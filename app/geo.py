@@ -0,0 +1,79 @@
+import math
+from typing import Hashable, Iterable, Sequence
+
+# Все расстояния (в памяти и в SQL, app.services.building.distance_km) считаются по сфере этого радиуса:
+# принадлежность кругу и отдаваемое расстояние не зависят от того, какой путь выполнил запрос
+EARTH_RADIUS_KM = 6371.0088
+
+# Запас для прямоугольного префильтра на случай ошибок округления у его границы
+BBOX_MARGIN = 1.01
+
+# Предел широты проекции Web Mercator: карта из тайлов квадратная
+MAX_MERCATOR_LATITUDE = 85.0511287798
+
+
+def bounding_box(lat: float, lon: float, radius: float) -> tuple[float, float, float, float]:
+    """
+    Прямоугольник (min_lat, max_lat, min_lon, max_lon), описанный вокруг круга радиусом radius км.
+
+    Если прямоугольник пересекает 180-й меридиан, min_lon > max_lon.
+    Если круг захватывает полюс, возвращается весь диапазон долгот.
+    """
+    angular = radius * BBOX_MARGIN / EARTH_RADIUS_KM
+    delta_lat = math.degrees(angular)
+    min_lat, max_lat = lat - delta_lat, lat + delta_lat
+    if min_lat <= -90 or max_lat >= 90 or angular >= math.pi / 2:
+        return max(min_lat, -90.0), min(max_lat, 90.0), -180.0, 180.0
+
+    delta_lon = math.degrees(math.asin(min(1.0, math.sin(angular) / math.cos(math.radians(lat)))))
+    min_lon, max_lon = lon - delta_lon, lon + delta_lon
+    if min_lon < -180:
+        min_lon += 360
+    if max_lon > 180:
+        max_lon -= 360
+    return min_lat, max_lat, min_lon, max_lon
+
+
+def haversine_km(lat: float, lon: float, points: Sequence[tuple[float, float]]) -> list[float]:
+    """Расстояния по сфере в км от точки (lat, lon) до каждой из points за один проход."""
+    radians, sin, cos, asin, sqrt = math.radians, math.sin, math.cos, math.asin, math.sqrt
+    lat1, lon1 = radians(lat), radians(lon)
+    cos_lat1 = cos(lat1)
+    diameter = 2 * EARTH_RADIUS_KM
+    result = []
+    for lat2, lon2 in points:
+        lat2, lon2 = radians(lat2), radians(lon2)
+        h = sin((lat2 - lat1) / 2) ** 2 + cos_lat1 * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+        result.append(diameter * asin(min(1.0, sqrt(h))))
+    return result
+
+
+def within_radius(lat: float, lon: float, points: Iterable[tuple[Hashable, float, float]],
+                  radius: float) -> dict[Hashable, float]:
+    """Отбирает точки (key, lat, lon) не дальше radius км по гаверсинусу и возвращает {key: расстояние в км}."""
+    points = list(points)
+    distances = haversine_km(lat, lon, [(p_lat, p_lon) for _, p_lat, p_lon in points])
+    return {key: d for (key, _, _), d in zip(points, distances) if d <= radius}
+
+
+def tile(lat: float, lon: float, zoom: int) -> tuple[int, int]:
+    """
+    Тайл (x, y) карты Web Mercator уровня zoom, в который попадает точка; y растет к югу.
+
+    Точки за пределами MAX_MERCATOR_LATITUDE относятся к крайнему ряду тайлов.
+    """
+    n = 1 << zoom
+    lat = max(-MAX_MERCATOR_LATITUDE, min(MAX_MERCATOR_LATITUDE, lat))
+    x = math.floor((lon + 180) / 360 * n)
+    y = math.floor((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_bounds(x: int, y: int, zoom: int) -> tuple[float, float, float, float]:
+    """Границы тайла (min_lat, max_lat, min_lon, max_lon) карты Web Mercator уровня zoom."""
+    n = 1 << zoom
+
+    def latitude(row: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return latitude(y + 1), latitude(y), x / n * 360 - 180, (x + 1) / n * 360 - 180
@@ -0,0 +1,211 @@
+"""
+Загрузка больших наборов данных в PostgreSQL через COPY FROM STDIN.
+
+Файл (CSV с заголовком или NDJSON) потоком копируется во временную таблицу, затем одной командой
+SQL ссылки проверяются и данные вливаются в основную таблицу. Все происходит в одной транзакции,
+поэтому читатели видят либо старые данные, либо загрузку целиком.
+
+    python -m app.loader buildings buildings.csv
+    python -m app.loader organizations organizations.ndjson
+    python -m app.loader links links.csv --replace
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import BinaryIO
+
+import psycopg
+from sqlalchemy.engine import make_url
+
+from app import config
+from app.activity_cache import CACHE_NAME as ACTIVITIES
+from app.aggregates import ACTIVITY_COUNTS_REBUILD, BUILDING_TILES_REBUILD, TILE_COUNTS_REBUILD
+from app.dto.activity import MAX_ACTIVITY_LEVEL
+from app.response_cache import BUILDINGS, ORGANIZATIONS
+
+# Размер блока при копировании CSV: память не зависит от размера файла
+COPY_BLOCK_SIZE = 1 << 20
+
+
+@dataclass
+class Target:
+    # Колонки файла и их типы во временной таблице
+    columns: dict[str, str]
+    required: tuple[str, ...]
+    # Вливание из временной таблицы stage (колонка n — порядковый номер строки в файле)
+    merge: str
+    cache_names: tuple[str, ...]
+    after: list[str] = field(default_factory=list)
+
+
+TARGETS = {
+    "buildings": Target(
+        columns={"address": "text", "latitude": "float8", "longitude": "float8"},
+        required=("address", "latitude", "longitude"),
+        # При повторе адреса в файле побеждает последняя строка
+        merge="""
+            INSERT INTO buildings (address, latitude, longitude)
+            SELECT DISTINCT ON (address) address, latitude, longitude FROM stage
+            WHERE address IS NOT NULL AND latitude IS NOT NULL AND longitude IS NOT NULL
+            ORDER BY address, n DESC
+            ON CONFLICT (address) DO UPDATE SET latitude = EXCLUDED.latitude, longitude = EXCLUDED.longitude
+        """,
+        cache_names=(BUILDINGS,),
+        # Координаты зданий меняют тайлы и зданий, и их организаций
+        after=[*TILE_COUNTS_REBUILD, *BUILDING_TILES_REBUILD],
+    ),
+    "activities": Target(
+        columns={"id": "int4", "name": "text", "parent_id": "int4"},
+        required=("id", "name"),
+        # Родитель должен быть в базе или в том же файле; FK проверяется в конце команды
+        merge="""
+            INSERT INTO activities (id, name, parent_id)
+            SELECT DISTINCT ON (s.id) s.id, s.name, s.parent_id FROM stage s
+            WHERE s.id IS NOT NULL AND (s.parent_id IS NULL
+                                        OR s.parent_id IN (SELECT id FROM activities)
+                                        OR s.parent_id IN (SELECT id FROM stage))
+            ORDER BY s.id, s.n DESC
+            ON CONFLICT (id) DO UPDATE SET name = EXCLUDED.name, parent_id = EXCLUDED.parent_id
+        """,
+        cache_names=(ACTIVITIES,),
+        after=[
+            "SELECT setval(pg_get_serial_sequence('activities', 'id'), (SELECT max(id) FROM activities))",
+            # Замыкание пересчитывается целиком; глубина ограничена, чтобы цикл в parent_id не зациклил запрос
+            "DELETE FROM activity_closure",
+            f"""
+            INSERT INTO activity_closure (ancestor_id, descendant_id, depth)
+            WITH RECURSIVE tree(ancestor_id, descendant_id, depth) AS (
+                SELECT id, id, 0 FROM activities
+                UNION ALL
+                SELECT tree.ancestor_id, activities.id, tree.depth + 1
+                FROM tree JOIN activities ON activities.parent_id = tree.descendant_id
+                WHERE tree.depth < {MAX_ACTIVITY_LEVEL}
+            )
+            SELECT ancestor_id, descendant_id, max(depth) FROM tree GROUP BY ancestor_id, descendant_id
+            """,
+            *ACTIVITY_COUNTS_REBUILD,
+        ],
+    ),
+    "organizations": Target(
+        columns={"id": "int4", "name": "text", "phone_numbers": "text", "building_address": "text"},
+        required=("id", "name", "building_address"),
+        # Здание ищется по адресу; строки с неизвестным адресом отбрасываются
+        merge="""
+            INSERT INTO organizations (id, name, phone_numbers, building_id)
+            SELECT DISTINCT ON (s.id) s.id, s.name, s.phone_numbers, b.id
+            FROM stage s JOIN buildings b ON b.address = s.building_address
+            ORDER BY s.id, s.n DESC
+            ON CONFLICT (id) DO UPDATE SET name = EXCLUDED.name, phone_numbers = EXCLUDED.phone_numbers,
+                                           building_id = EXCLUDED.building_id
+        """,
+        cache_names=(ORGANIZATIONS,),
+        after=["SELECT setval(pg_get_serial_sequence('organizations', 'id'), (SELECT max(id) FROM organizations))",
+               *TILE_COUNTS_REBUILD],
+    ),
+    "links": Target(
+        columns={"organization_id": "int4", "activity_id": "int4"},
+        required=("organization_id", "activity_id"),
+        # Связи с несуществующими организациями и деятельностями отбрасываются
+        merge="""
+            INSERT INTO organization_activity (organization_id, activity_id)
+            SELECT DISTINCT s.organization_id, s.activity_id FROM stage s
+            JOIN organizations o ON o.id = s.organization_id
+            JOIN activities a ON a.id = s.activity_id
+            ON CONFLICT DO NOTHING
+        """,
+        cache_names=(ORGANIZATIONS,),
+        after=list(ACTIVITY_COUNTS_REBUILD),
+    ),
+}
+
+
+def _copy_csv(cursor: psycopg.Cursor, target: Target, source: BinaryIO) -> int:
+    header = next(csv.reader([source.readline().decode("utf-8-sig")]))
+    _check_columns(target, header)
+    with cursor.copy(f"COPY stage ({', '.join(header)}) FROM STDIN WITH (FORMAT csv)") as copy:
+        while block := source.read(COPY_BLOCK_SIZE):
+            copy.write(block)
+    return cursor.rowcount
+
+
+def _copy_ndjson(cursor: psycopg.Cursor, target: Target, source: BinaryIO) -> int:
+    columns = list(target.columns)
+    with cursor.copy(f"COPY stage ({', '.join(columns)}) FROM STDIN") as copy:
+        for line in source:
+            if line.strip():
+                record = json.loads(line)
+                copy.write_row([record.get(column) for column in columns])
+    return cursor.rowcount
+
+
+def _check_columns(target: Target, columns: list[str]):
+    unknown = set(columns) - set(target.columns)
+    missing = set(target.required) - set(columns)
+    if unknown or missing:
+        raise ValueError(f"Unexpected columns {sorted(unknown)}, missing columns {sorted(missing)}")
+
+
+def _report(message: str, rows: int, started: float):
+    elapsed = time.perf_counter() - started
+    print(f"{message} {rows} rows in {elapsed:.1f} s ({rows / max(elapsed, 1e-9):.0f} rows/s)", file=sys.stderr)
+
+
+def load(entity: str, source: BinaryIO, fmt: str, replace: bool = False, conninfo: str = None) -> tuple[int, int]:
+    """Загружает файл в таблицу entity; возвращает (прочитано строк, записано строк)."""
+    target = TARGETS[entity]
+    conninfo = conninfo or make_url(config.DATABASE_URL).set(drivername="postgresql").render_as_string(False)
+    with psycopg.connect(conninfo) as conn, conn.cursor() as cursor:
+        columns = ", ".join(f"{name} {sql_type}" for name, sql_type in target.columns.items())
+        cursor.execute(f"CREATE TEMP TABLE stage (n bigint GENERATED ALWAYS AS IDENTITY, {columns}) ON COMMIT DROP")
+
+        started = time.perf_counter()
+        staged = (_copy_csv if fmt == "csv" else _copy_ndjson)(cursor, target, source)
+        _report(f"{entity}: staged", staged, started)
+
+        started = time.perf_counter()
+        if replace:
+            # DELETE, а не TRUNCATE: до commit читатели продолжают видеть старые связи
+            cursor.execute("DELETE FROM organization_activity")
+        cursor.execute("ANALYZE stage")
+        cursor.execute(target.merge)
+        merged = cursor.rowcount
+        for statement in target.after:
+            cursor.execute(statement)
+        if entity == "activities":
+            # Слишком глубокое дерево или цикл в parent_id — загрузка откатывается целиком
+            cursor.execute("SELECT max(depth) FROM activity_closure")
+            if (cursor.fetchone()[0] or 0) >= MAX_ACTIVITY_LEVEL:
+                raise ValueError(f"The maximum level of nesting of activities is {MAX_ACTIVITY_LEVEL} levels")
+        cursor.execute("UPDATE cache_versions SET version = version + 1 WHERE name = ANY(%s)",
+                       [list(target.cache_names)])
+        _report(f"{entity}: merged", merged, started)
+        print(f"{entity}: skipped {staged - merged} rows", file=sys.stderr)
+    return staged, merged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.loader", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("entity", choices=TARGETS)
+    parser.add_argument("path", help="CSV (с заголовком) или NDJSON; '-' — stdin")
+    parser.add_argument("--format", choices=("csv", "ndjson"),
+                        help="по умолчанию определяется по расширению файла")
+    parser.add_argument("--replace", action="store_true", help="заменить все связи (только для links)")
+    parser.add_argument("--database-url", help="по умолчанию DATABASE_URL")
+    args = parser.parse_args(argv)
+    if args.replace and args.entity != "links":
+        parser.error("--replace is supported for links only")
+    fmt = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+    conninfo = args.database_url and make_url(args.database_url).set(drivername="postgresql").render_as_string(False)
+
+    if args.path == "-":
+        load(args.entity, sys.stdin.buffer, fmt, args.replace, conninfo)
+    else:
+        with open(args.path, "rb") as source:
+            load(args.entity, source, fmt, args.replace, conninfo)
+
+
+if __name__ == "__main__":
+    main()
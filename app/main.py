@@ -1,11 +1,22 @@
 import uvicorn
 from fastapi import FastAPI
-from app.routers import organization, building, activity
+from app import config
+from app.compression import CompressionMiddleware
+from app.metrics import MetricsMiddleware
+from app.routers import organization, building, activity, metrics, stats, tile
+from app.serialization import FastJSONResponse
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
+if config.RESPONSE_COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware, minimum_size=config.RESPONSE_COMPRESSION_MIN_SIZE)
+if config.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(metrics.router)
 app.include_router(activity.router)
 app.include_router(building.router)
 app.include_router(organization.router)
+app.include_router(stats.router)
+app.include_router(tile.router)
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host='0.0.0.0', port=8080, reload=True)
@@ -0,0 +1,166 @@
+import logging
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import Engine, event
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app import config
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    db_time: float = 0.0
+    rows: int = 0
+
+
+# Статистика текущего запроса; SQLAlchemy выполняет запросы в greenlet с тем же контекстом, что и корутина
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.db_time = 0.0
+        self.rows = 0
+        self.over_budget = 0
+
+
+# Метрики процесса: у каждого воркера uvicorn свои, Prometheus собирает их по отдельности
+_routes: dict[tuple[str, str, int], RouteMetrics] = {}
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_started"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _request_stats.get()
+    if stats is None:
+        return
+    stats.queries += 1
+    stats.db_time += time.perf_counter() - conn.info["query_started"]
+    if cursor.rowcount > 0 and cursor.description is not None:
+        stats.rows += cursor.rowcount
+
+
+def instrument(engine: Engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _record(scope: Scope, status: int, elapsed: float, stats: RequestStats):
+    route = scope.get("route")
+    # Шаблон пути, а не сам путь: иначе каждый ID дал бы отдельную серию
+    path = route.path if route is not None else "unmatched"
+    metrics = _routes.get((scope["method"], path, status))
+    if metrics is None:
+        metrics = _routes[(scope["method"], path, status)] = RouteMetrics()
+    metrics.latency.observe(elapsed)
+    metrics.queries.observe(stats.queries)
+    metrics.db_time += stats.db_time
+    metrics.rows += stats.rows
+    if stats.queries > config.QUERY_BUDGET:
+        metrics.over_budget += 1
+        logger.warning("%s %s made %d SQL queries (budget %d)", scope["method"], scope["path"], stats.queries,
+                       config.QUERY_BUDGET)
+
+
+class MetricsMiddleware:
+    """
+    Замеряет каждый HTTP-запрос: время ответа, число SQL-запросов, время в базе и число прочитанных строк.
+
+    Итоги добавляются в заголовок Server-Timing и в метрики для /metrics.
+    Для потоковых ответов учитывается только работа до отправки заголовков.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                elapsed = (time.perf_counter() - started) * 1000
+                MutableHeaders(scope=message).append(
+                    "Server-Timing",
+                    f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries", app;dur={elapsed:.1f}',
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_stats.reset(token)
+            _record(scope, status, time.perf_counter() - started, stats)
+
+
+def _labels(method: str, path: str, status: int, **extra) -> str:
+    labels = {"method": method, "route": path, "status": str(status), **extra}
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+
+def _render_histogram(lines: list[str], name: str, key: tuple, histogram: Histogram):
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        lines.append(f"{name}_bucket{_labels(*key, le=str(bound))} {count}")
+    lines.append(f'{name}_bucket{_labels(*key, le="+Inf")} {histogram.count}')
+    lines.append(f"{name}_sum{_labels(*key)} {histogram.sum}")
+    lines.append(f"{name}_count{_labels(*key)} {histogram.count}")
+
+
+def render() -> str:
+    """Метрики в текстовом формате Prometheus."""
+    routes = list(_routes.items())
+    lines = ["# HELP http_request_duration_seconds Время обработки запроса.",
+             "# TYPE http_request_duration_seconds histogram"]
+    for key, metrics in routes:
+        _render_histogram(lines, "http_request_duration_seconds", key, metrics.latency)
+    lines += ["# HELP http_request_db_queries Число SQL-запросов на HTTP-запрос.",
+              "# TYPE http_request_db_queries histogram"]
+    for key, metrics in routes:
+        _render_histogram(lines, "http_request_db_queries", key, metrics.queries)
+    counters = (
+        ("http_request_db_seconds_total", "Суммарное время SQL-запросов.", "db_time"),
+        ("http_request_db_rows_total", "Строк прочитано из базы.", "rows"),
+        ("http_request_query_budget_exceeded_total", "Запросов, превысивших QUERY_BUDGET.", "over_budget"),
+    )
+    for name, description, attr in counters:
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} counter"]
+        lines += [f"{name}{_labels(*key)} {getattr(metrics, attr)}" for key, metrics in routes]
+    return "\n".join(lines) + "\n"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Float, Table
+from sqlalchemy import Column, Integer, String, ForeignKey, Float, Table, Index, func
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -14,6 +14,17 @@ class Activity(Base):
     children = relationship("Activity", backref="parent", remote_side=[id])
 
 
+# Транзитивное замыкание дерева деятельностей: все пары (предок, потомок) с расстоянием между ними,
+# включая пару (id, id) с depth = 0. Поддерживается в create_activity / delete_activity.
+activity_closure = Table(
+    "activity_closure", Base.metadata,
+    Column("ancestor_id", Integer, ForeignKey("activities.id", ondelete="CASCADE"), primary_key=True),
+    Column("descendant_id", Integer, ForeignKey("activities.id", ondelete="CASCADE"), primary_key=True),
+    Column("depth", Integer, nullable=False),
+    Index("ix_activity_closure_descendant_id_depth", "descendant_id", "depth"),
+)
+
+
 class Building(Base):
     __tablename__ = "buildings"
 
@@ -23,11 +34,16 @@ class Building(Base):
     longitude = Column(Float, nullable=False)
     organizations = relationship("Organization", back_populates="building")
 
+    __table_args__ = (
+        Index("ix_buildings_latitude_longitude", "latitude", "longitude"),
+    )
+
 
 organization_activity = Table(
     "organization_activity", Base.metadata,
-    Column("organization_id", Integer, ForeignKey("organizations.id")),
-    Column("activity_id", Integer, ForeignKey("activities.id"))
+    Column("organization_id", Integer, ForeignKey("organizations.id"), primary_key=True),
+    Column("activity_id", Integer, ForeignKey("activities.id"), primary_key=True),
+    Index("ix_organization_activity_activity_id_organization_id", "activity_id", "organization_id"),
 )
 
 
@@ -37,6 +53,51 @@ class Organization(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
     phone_numbers = Column(String, nullable=True)
-    building_id = Column(Integer, ForeignKey("buildings.id"))
+    building_id = Column(Integer, ForeignKey("buildings.id"), index=True)
     building = relationship("Building", back_populates="organizations")
     activities = relationship("Activity", secondary=organization_activity, backref="organizations")
+
+    __table_args__ = (
+        Index("ix_organizations_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+        # Префикс и порядок (lower(name), id) поиска по префиксу; COLLATE "C" есть только в PostgreSQL
+        Index("ix_organizations_name_lower_prefix", func.lower(name).collate("C"), id).ddl_if(dialect="postgresql"),
+    )
+
+
+# Версии кэшируемых в памяти наборов данных. Увеличиваются в той же транзакции, что и запись,
+# чтобы кэши других воркеров могли обнаружить устаревание одним запросом по первичному ключу.
+cache_versions = Table(
+    "cache_versions", Base.metadata,
+    Column("name", String, primary_key=True),
+    Column("version", Integer, nullable=False, server_default="0"),
+)
+
+
+# Счетчики для агрегатных запросов; поддерживаются в той же транзакции, что и запись (см. app.aggregates).
+# Организации с деятельностью из поддерева activity_id, каждая организация считается один раз.
+activity_organization_counts = Table(
+    "activity_organization_counts", Base.metadata,
+    Column("activity_id", Integer, ForeignKey("activities.id", ondelete="CASCADE"), primary_key=True),
+    Column("organizations", Integer, nullable=False),
+)
+
+# Организации в тайле карты (zoom, x, y) для уровней 0..app.aggregates.TILE_MAX_ZOOM; пустых тайлов в таблице нет
+tile_counts = Table(
+    "tile_counts", Base.metadata,
+    Column("zoom", Integer, primary_key=True),
+    Column("x", Integer, primary_key=True),
+    Column("y", Integer, primary_key=True),
+    Column("organizations", Integer, nullable=False),
+)
+
+
+# Здания в тайле карты: число и суммы координат (центр кластера — среднее) для уровней 0..TILE_MAX_ZOOM
+building_tiles = Table(
+    "building_tiles", Base.metadata,
+    Column("zoom", Integer, primary_key=True),
+    Column("x", Integer, primary_key=True),
+    Column("y", Integer, primary_key=True),
+    Column("buildings", Integer, nullable=False),
+    Column("latitude_sum", Float, nullable=False),
+    Column("longitude_sum", Float, nullable=False),
+)
@@ -0,0 +1,33 @@
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import ColumnElement, Select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import InstrumentedAttribute
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+async def paginate(db: AsyncSession, statement: Select, key: InstrumentedAttribute, limit: int,
+                   after: Optional[int], fetch: Callable[[AsyncSession, Select], Awaitable[list]],
+                   sort_key: Optional[ColumnElement] = None) -> dict:
+    """
+    Keyset-пагинация: следующая страница начинается сразу после ключа after, без OFFSET.
+
+    Запрашивается на одну строку больше limit, чтобы понять, есть ли следующая страница.
+    fetch выполняет запрос страницы и возвращает строки (см. app.read_model).
+    sort_key (например, расстояние) сортирует строки раньше key; курсором остается key последней строки,
+    а её значение sort_key вычисляется подзапросом по тем же таблицам.
+    """
+    if after is not None and sort_key is None:
+        statement = statement.where(key > after)
+    elif after is not None:
+        after_sort_key = statement.with_only_columns(sort_key).where(key == after).scalar_subquery().correlate(None)
+        statement = statement.where(tuple_(sort_key, key) > tuple_(after_sort_key, after))
+    order = (key,) if sort_key is None else (sort_key, key)
+    items = await fetch(db, statement.order_by(*order).limit(limit + 1))
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = getattr(items[-1], key.key)
+    return {"items": items, "next_cursor": next_cursor}
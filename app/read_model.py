@@ -0,0 +1,97 @@
+"""
+Чтение для GET-запросов без ORM.
+
+Запросы выбирают только нужные колонки через Core, строки собираются в dataclass со __slots__:
+без identity map, отслеживания изменений и ленивых связей. Ответы строятся из них так же, как из моделей
+(from_attributes). Текст SQL не зависит от параметров, поэтому SQLAlchemy берет его из кэша компиляции,
+а psycopg после prepare_threshold выполнений использует подготовленное выражение на сервере.
+"""
+from dataclasses import dataclass, field
+from typing import Optional
+
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Activity, Building, Organization, organization_activity
+
+
+@dataclass(slots=True)
+class BuildingRow:
+    id: int
+    address: str
+    latitude: float
+    longitude: float
+    distance: Optional[float] = None
+
+
+@dataclass(slots=True)
+class ActivityRow:
+    id: int
+    name: str
+    parent_id: Optional[int]
+
+
+@dataclass(slots=True)
+class OrganizationRow:
+    id: int
+    name: str
+    phone_numbers: Optional[str]
+    building: BuildingRow
+    activities: list[ActivityRow] = field(default_factory=list)
+    distance: Optional[float] = None
+
+
+BUILDING_COLUMNS = (Building.id, Building.address, Building.latitude, Building.longitude)
+ACTIVITY_COLUMNS = (Activity.id, Activity.name, Activity.parent_id)
+ORGANIZATION_COLUMNS = (Organization.id, Organization.name, Organization.phone_numbers)
+
+
+def select_buildings() -> Select:
+    return select(*BUILDING_COLUMNS)
+
+
+def select_activities() -> Select:
+    return select(*ACTIVITY_COLUMNS)
+
+
+def select_organization_ids() -> Select:
+    # Организации без здания (building_id IS NULL) отсекаются до LIMIT: иначе страница после внутреннего
+    # соединения со зданием окажется короче limit и пагинация остановится раньше времени
+    return select(Organization.id).where(Organization.building_id.isnot(None))
+
+
+async def buildings(db: AsyncSession, statement: Select) -> list[BuildingRow]:
+    return [BuildingRow(*row) for row in (await db.execute(statement)).tuples()]
+
+
+async def activities(db: AsyncSession, statement: Select) -> list[ActivityRow]:
+    return [ActivityRow(*row) for row in (await db.execute(statement)).tuples()]
+
+
+async def organizations(db: AsyncSession, page: Select) -> list[OrganizationRow]:
+    """
+    Организации страницы вместе со зданием и деятельностями одним запросом.
+
+    page выбирает ID организаций (первая колонка) с фильтрами, ORDER BY и LIMIT; если колонок несколько,
+    последняя — ключ сортировки. Здание и деятельности присоединяются к уже отобранной странице, поэтому
+    page должен сам исключать организации без здания (см. select_organization_ids).
+    """
+    page = page.subquery()
+    page_id, sort_key = page.c[0], page.c[len(page.c) - 1]
+    statement = select(*ORGANIZATION_COLUMNS, *BUILDING_COLUMNS, *ACTIVITY_COLUMNS) \
+        .select_from(page) \
+        .join(Organization, Organization.id == page_id) \
+        .join(Building, Building.id == Organization.building_id) \
+        .outerjoin(organization_activity, organization_activity.c.organization_id == Organization.id) \
+        .outerjoin(Activity, Activity.id == organization_activity.c.activity_id) \
+        .order_by(sort_key, Organization.id, Activity.id)
+
+    # Строк по одной на деятельность; порядок организаций сохраняется порядком вставки в dict
+    orgs: dict[int, OrganizationRow] = {}
+    for row in (await db.execute(statement)).tuples():
+        org = orgs.get(row[0])
+        if org is None:
+            org = orgs[row[0]] = OrganizationRow(row[0], row[1], row[2], BuildingRow(*row[3:7]))
+        if row[7] is not None:
+            org.activities.append(ActivityRow(*row[7:10]))
+    return list(orgs.values())
@@ -0,0 +1,129 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from fastapi import Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import config
+from app.activity_cache import CACHE_NAME as ACTIVITIES
+from app.cache_versions import get_versions
+from app.serialization import negotiate, render
+
+BUILDINGS = "buildings"
+ORGANIZATIONS = "organizations"
+# Организация отдается вместе со зданием и деятельностями, поэтому зависит от всех трех сущностей
+ORGANIZATION_TAGS = (ORGANIZATIONS, BUILDINGS, ACTIVITIES)
+
+
+class MemoryBackend:
+    """LRU-кэш ответов в памяти процесса с ограничением по числу записей и времени жизни."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, bytes, tuple[str, ...]]] = OrderedDict()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, body, _ = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return body
+
+    async def set(self, key: str, body: bytes, tags: Iterable[str]):
+        self._entries[key] = (time.monotonic() + self.ttl, body, tuple(tags))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def invalidate(self, tag: str):
+        for key in [key for key, (_, _, tags) in self._entries.items() if tag in tags]:
+            del self._entries[key]
+
+
+class RedisBackend:
+    """
+    Кэш ответов в Redis (или совместимом хранилище), общий для всех воркеров.
+
+    Ключ содержит версии сущностей, поэтому после записи старые ответы перестают запрашиваться
+    и удаляются самим Redis по истечении ttl.
+    """
+
+    def __init__(self, url: str, ttl: float):
+        try:
+            from redis import asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("RESPONSE_CACHE_BACKEND=redis requires the redis package") from e
+        self.ttl = ttl
+        self._client = redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._client.get(key)
+
+    async def set(self, key: str, body: bytes, tags: Iterable[str]):
+        await self._client.set(key, body, ex=max(1, int(self.ttl)))
+
+    async def invalidate(self, tag: str):
+        pass
+
+
+def _etags(header: Optional[str]) -> set[str]:
+    if not header:
+        return set()
+    # If-None-Match сравнивается слабо: W/"x" совпадает с "x"
+    return {tag.strip().removeprefix("W/") for tag in header.split(",")}
+
+
+class ResponseCache:
+    """
+    Кэш сериализованных ответов GET-запросов.
+
+    Ключ и ETag строятся из пути, параметров запроса и версий сущностей (tags) из таблицы cache_versions.
+    create_* / delete_* поднимают версию своей сущности, поэтому запись в любом воркере делает
+    старые ответы недостижимыми, а локальные записи кэша удаляются сразу через invalidate.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    async def respond(self, request: Request, db: AsyncSession, tags: Iterable[str], response_model: Any,
+                      build: Callable[[], Awaitable[Any]]):
+        if not config.RESPONSE_CACHE_ENABLED:
+            return await build()
+
+        versions = await get_versions(db, tags)
+        media_type = negotiate(request)
+        key = repr((request.url.path, sorted(request.query_params.multi_items()), sorted(versions.items()),
+                    media_type))
+        opaque_tag = '"' + hashlib.sha256(key.encode()).hexdigest()[:32] + '"'
+        # ETag слабый: CompressionMiddleware отдает тот же ответ в identity, gzip и br, а сильный валидатор
+        # обязан различаться для каждого Content-Encoding
+        headers = {"ETag": "W/" + opaque_tag, "Vary": "Accept"}
+        if_none_match = _etags(request.headers.get("if-none-match"))
+        if opaque_tag in if_none_match or "*" in if_none_match:
+            return Response(status_code=304, headers=headers)
+
+        body = await self.backend.get(opaque_tag)
+        if body is None:
+            body = render(response_model, await build(), media_type)
+            await self.backend.set(opaque_tag, body, versions)
+        return Response(body, media_type=media_type, headers=headers)
+
+    async def invalidate(self, *tags: str):
+        for tag in tags:
+            await self.backend.invalidate(tag)
+
+
+def _create_backend():
+    if config.RESPONSE_CACHE_BACKEND == "redis":
+        return RedisBackend(config.RESPONSE_CACHE_REDIS_URL, config.RESPONSE_CACHE_TTL)
+    return MemoryBackend(config.RESPONSE_CACHE_MAX_ENTRIES, config.RESPONSE_CACHE_TTL)
+
+
+response_cache = ResponseCache(_create_backend())
@@ -1,15 +1,20 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Body, Depends, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.dto.activity import Activity as ActivityDTO, ActivityCreate
+from app.dto.bulk import MAX_BULK_SIZE, BulkResult
+from app.dto.pagination import Page
+from app.pagination import DEFAULT_LIMIT, MAX_LIMIT
+from app.response_cache import ACTIVITIES, response_cache
+from app.serialization import respond
 from app.services import activity as ActivityService
 
 router = APIRouter()
 
 
 @router.post("/activities/", response_model=ActivityDTO, tags=['activities'])
-def create_activity(activity: ActivityCreate, db: Session = Depends(get_db)):
+async def create_activity(activity: ActivityCreate, db: AsyncSession = Depends(get_db)):
     """
         Создать новую деятельность.
 
@@ -17,11 +22,26 @@ def create_activity(activity: ActivityCreate, db: Session = Depends(get_db)):
 
         Возвращает созданную деятельность.
         """
-    return ActivityService.create_activity(activity=activity, db=db)
+    return await ActivityService.create_activity(activity=activity, db=db)
+
+
+@router.post("/activities/bulk", response_model=BulkResult, tags=['activities'])
+async def create_activities(activities: list[ActivityCreate] = Body(..., max_length=MAX_BULK_SIZE),
+                            db: AsyncSession = Depends(get_db)):
+    """
+        Создать деятельности пачкой.
+
+        Этот метод проверяет родителей всех записей одним запросом и сохраняет корректные записи в одной транзакции.
+        Родитель должен существовать до запроса; записи с несуществующим родителем или превышением
+        уровня вложенности не сохраняются.
+
+        Возвращает ID созданных деятельностей в порядке переданных записей и ошибки по отдельным записям.
+        """
+    return await ActivityService.create_activities(activities=activities, db=db)
 
 
 @router.get("/activities/{activity_id}", response_model=ActivityDTO, tags=['activities'])
-def read_activity(activity_id: int, db: Session = Depends(get_db)):
+async def read_activity(request: Request, activity_id: int, db: AsyncSession = Depends(get_read_db)):
     """
         Получить деятельность по ID.
 
@@ -32,23 +52,30 @@ def read_activity(activity_id: int, db: Session = Depends(get_db)):
 
         Возвращает деятельность.
         """
-    return ActivityService.read_activity(activity_id=activity_id, db=db)
+    return respond(request, ActivityDTO, await ActivityService.read_activity(activity_id=activity_id, db=db))
 
 
-@router.get("/activities/", response_model=list[ActivityDTO], tags=['activities'])
-def list_activities(db: Session = Depends(get_db)):
+@router.get("/activities/", response_model=Page[ActivityDTO], tags=['activities'])
+async def list_activities(request: Request, limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+                          after: int = Query(None), db: AsyncSession = Depends(get_read_db)):
     """
         Получить список всех деятельностей.
 
-        Этот метод возвращает список всех деятельностей, зарегистрированных в системе.
+        Этот метод возвращает список всех деятельностей, зарегистрированных в системе, постранично.
+
+        - **limit**: Максимальное количество записей на странице.
+        - **after**: Курсор — значение `next_cursor` из предыдущей страницы (опционально).
+
+        Ответ кэшируется; при совпадении заголовка `If-None-Match` с ETag возвращается 304.
 
-        Возвращает список деятельностей.
+        Возвращает страницу деятельностей и курсор следующей страницы.
         """
-    return ActivityService.list_activities(db=db)
+    return await response_cache.respond(request, db, (ACTIVITIES,), Page[ActivityDTO],
+                                        lambda: ActivityService.list_activities(db=db, limit=limit, after=after))
 
 
 @router.delete("/activities/{activity_id}", tags=['activities'])
-def delete_activity(activity_id: int, db: Session = Depends(get_db)):
+async def delete_activity(activity_id: int, db: AsyncSession = Depends(get_db)):
     """
         Удалить деятельность по ID.
 
@@ -59,4 +86,4 @@ def delete_activity(activity_id: int, db: Session = Depends(get_db)):
 
         Возвращает сообщение об успешном удалении.
         """
-    return ActivityService.delete_activity(activity_id=activity_id, db=db)
+    return await ActivityService.delete_activity(activity_id=activity_id, db=db)
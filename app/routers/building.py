@@ -1,15 +1,20 @@
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
-
-from app.database import get_db
-from app.dto.building import Building as BuildingDTO, BuildingCreate
+from fastapi import APIRouter, Body, Depends, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import get_db, get_read_db
+from app.dto.building import Building as BuildingDTO, BuildingCreate, BuildingWithDistance as BuildingWithDistanceDTO
+from app.dto.bulk import MAX_BULK_SIZE, BulkResult
+from app.dto.pagination import Page
+from app.pagination import DEFAULT_LIMIT, MAX_LIMIT
+from app.response_cache import BUILDINGS, response_cache
+from app.serialization import respond
 from app.services import building as BuildingService
 
 router = APIRouter()
 
 
 @router.post("/buildings/", response_model=BuildingDTO, tags=['buildings'])
-def create_building(building: BuildingCreate, db: Session = Depends(get_db)):
+async def create_building(building: BuildingCreate, db: AsyncSession = Depends(get_db)):
     """
         Создать новое здание.
 
@@ -17,20 +22,38 @@ def create_building(building: BuildingCreate, db: Session = Depends(get_db)):
 
         Возвращает созданное здание.
         """
-    return BuildingService.create_building(building=building, db=db)
+    return await BuildingService.create_building(building=building, db=db)
+
+
+@router.post("/buildings/bulk", response_model=BulkResult, tags=['buildings'])
+async def upsert_buildings(buildings: list[BuildingCreate] = Body(..., max_length=MAX_BULK_SIZE),
+                           db: AsyncSession = Depends(get_db)):
+    """
+        Создать или обновить здания пачкой.
+
+        Этот метод сохраняет все переданные здания одной командой INSERT ... ON CONFLICT:
+        здание с уже существующим адресом обновляется (координаты), остальные создаются.
+
+        Возвращает ID зданий в порядке переданных записей.
+        """
+    return await BuildingService.upsert_buildings(buildings=buildings, db=db)
 
 
-@router.get("/buildings/by-area", response_model=list[BuildingDTO], tags=['buildings'])
-def get_buildings_by_area(lat: float, lon: float, radius: float = Query(None),
-                          min_lat: float = Query(None), max_lat: float = Query(None),
-                          min_lon: float = Query(None), max_lon: float = Query(None),
-                          db: Session = Depends(get_db)):
+@router.get("/buildings/by-area", response_model=Page[BuildingWithDistanceDTO], tags=['buildings'])
+async def get_buildings_by_area(request: Request, lat: float, lon: float, radius: float = Query(None),
+                                min_lat: float = Query(None), max_lat: float = Query(None),
+                                min_lon: float = Query(None), max_lon: float = Query(None),
+                                order_by_distance: bool = Query(False),
+                                limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT), after: int = Query(None),
+                                db: AsyncSession = Depends(get_read_db)):
     """
         Получить здания по географической области.
 
-        Этот метод возвращает список зданий, находящихся в пределах указанной области.
+        Этот метод возвращает постранично здания, находящиеся в пределах указанной области.
         Область может быть задана либо радиусом вокруг точки, либо прямоугольником.
 
+        Нужно задать radius или все четыре границы прямоугольника, иначе возвращается ошибка 400.
+
         - **lat**: Широта центра области.
         - **lon**: Долгота центра области.
         - **radius**: Радиус поиска в километрах (опционально).
@@ -38,15 +61,21 @@ def get_buildings_by_area(lat: float, lon: float, radius: float = Query(None),
         - **max_lat**: Максимальная широта (опционально).
         - **min_lon**: Минимальная долгота (опционально).
         - **max_lon**: Максимальная долгота (опционально).
+        - **order_by_distance**: Отсортировать результат по удалению от точки (lat, lon).
+        - **limit**: Максимальное количество записей на странице.
+        - **after**: Курсор — значение `next_cursor` из предыдущей страницы (опционально).
 
-        Возвращает список зданий.
+        Возвращает страницу зданий с расстоянием до точки (lat, lon) в километрах и курсор следующей страницы.
         """
-    return BuildingService.get_buildings_by_area(lat=lat, lon=lon, radius=radius, min_lat=min_lat,
-                                                 max_lat=max_lat, min_lon=min_lon, max_lon=max_lon, db=db)
+    page = await BuildingService.get_buildings_by_area(lat=lat, lon=lon, radius=radius, min_lat=min_lat,
+                                                       max_lat=max_lat, min_lon=min_lon, max_lon=max_lon,
+                                                       order_by_distance=order_by_distance, limit=limit, after=after,
+                                                       db=db)
+    return respond(request, Page[BuildingWithDistanceDTO], page)
 
 
 @router.get("/buildings/{building_id}", response_model=BuildingDTO, tags=['buildings'])
-def read_building(building_id: int, db: Session = Depends(get_db)):
+async def read_building(request: Request, building_id: int, db: AsyncSession = Depends(get_read_db)):
     """
         Получить здание по ID.
 
@@ -57,31 +86,39 @@ def read_building(building_id: int, db: Session = Depends(get_db)):
 
         Возвращает здание.
         """
-    return BuildingService.read_building(building_id=building_id, db=db)
+    return respond(request, BuildingDTO, await BuildingService.read_building(building_id=building_id, db=db))
 
 
-@router.get("/buildings/", response_model=list[BuildingDTO], tags=['buildings'])
-def list_buildings(db: Session = Depends(get_db)):
+@router.get("/buildings/", response_model=Page[BuildingDTO], tags=['buildings'])
+async def list_buildings(request: Request, limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+                         after: int = Query(None), db: AsyncSession = Depends(get_read_db)):
     """
         Получить список всех зданий.
 
-        Этот метод возвращает список всех зданий, зарегистрированных в системе.
+        Этот метод возвращает список всех зданий, зарегистрированных в системе, постранично.
+
+        - **limit**: Максимальное количество записей на странице.
+        - **after**: Курсор — значение `next_cursor` из предыдущей страницы (опционально).
+
+        Ответ кэшируется; при совпадении заголовка `If-None-Match` с ETag возвращается 304.
 
-        Возвращает список зданий.
+        Возвращает страницу зданий и курсор следующей страницы.
         """
-    return BuildingService.list_buildings(db=db)
+    return await response_cache.respond(request, db, (BUILDINGS,), Page[BuildingDTO],
+                                        lambda: BuildingService.list_buildings(db=db, limit=limit, after=after))
 
 
 @router.delete("/buildings/{building_id}", tags=['buildings'])
-def delete_building(building_id: int, db: Session = Depends(get_db)):
+async def delete_building(building_id: int, db: AsyncSession = Depends(get_db)):
     """
         Удалить здание по ID.
 
         Этот метод удаляет здание с указанным ID.
         Если здание не найдено, возвращается ошибка 404.
+        Если в здании есть организации, возвращается ошибка 409: их нужно сначала перенести или удалить.
 
         - **building_id**: ID здания.
 
         Возвращает сообщение об успешном удалении.
         """
-    return BuildingService.delete_building(building_id=building_id, db=db)
+    return await BuildingService.delete_building(building_id=building_id, db=db)
@@ -0,0 +1,17 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app import metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics():
+    """
+        Метрики в формате Prometheus.
+
+        Время ответа и число SQL-запросов по маршрутам, суммарное время в базе и число прочитанных строк.
+        Метрики считаются отдельно в каждом процессе.
+        """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
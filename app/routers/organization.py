@@ -1,37 +1,66 @@
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
-
-from app.database import get_db
-from app.dto.organization import Organization as OrganizationDTO, OrganizationCreate
+from typing import Literal
+
+from fastapi import APIRouter, Body, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import get_db, get_read_db, read_sessionmaker
+from app.dto.bulk import MAX_BULK_SIZE, BulkResult
+from app.dto.organization import Organization as OrganizationDTO, OrganizationCreate, \
+    OrganizationWithDistance as OrganizationWithDistanceDTO
+from app.dto.pagination import Page
+from app.pagination import DEFAULT_LIMIT, MAX_LIMIT
+from app.response_cache import ORGANIZATION_TAGS, response_cache
+from app.serialization import respond
 from app.services import organization as OrganizationService
 
 router = APIRouter()
 
 
 @router.post("/organizations/", response_model=OrganizationDTO, tags=['organizations'])
-def create_organization(org: OrganizationCreate, db: Session = Depends(get_db)):
+async def create_organization(org: OrganizationCreate, db: AsyncSession = Depends(get_db)):
     """
         Создать новую организацию.
 
         Этот метод создает новую организацию на основе данных, переданных в запросе.
         Поле `activity_ids` используется для связывания организации с активностями.
+        Если здание или одна из активностей не найдены, возвращается ошибка 404 и организация не создается.
 
         Возвращает созданную организацию.
         """
-    return OrganizationService.create_organization(org=org, db=db)
+    return await OrganizationService.create_organization(org=org, db=db)
+
+
+@router.post("/organizations/bulk", response_model=BulkResult, tags=['organizations'])
+async def create_organizations(orgs: list[OrganizationCreate] = Body(..., max_length=MAX_BULK_SIZE),
+                               db: AsyncSession = Depends(get_db)):
+    """
+        Создать организации пачкой.
+
+        Этот метод проверяет здания и активности всех записей двумя запросами
+        и сохраняет корректные записи вместе со связями в одной транзакции.
+        Записи со ссылкой на несуществующее здание или активность не сохраняются.
+
+        Возвращает ID созданных организаций в порядке переданных записей и ошибки по отдельным записям.
+        """
+    return await OrganizationService.create_organizations(orgs=orgs, db=db)
 
 
-@router.get("/organizations/by-area", response_model=list[OrganizationDTO], tags=['organizations'])
-def get_organizations_by_area(lat: float, lon: float, radius: float = Query(None),
-                              min_lat: float = Query(None), max_lat: float = Query(None),
-                              min_lon: float = Query(None), max_lon: float = Query(None),
-                              db: Session = Depends(get_db)):
+@router.get("/organizations/by-area", response_model=Page[OrganizationWithDistanceDTO], tags=['organizations'])
+async def get_organizations_by_area(request: Request, lat: float, lon: float, radius: float = Query(None),
+                                    min_lat: float = Query(None), max_lat: float = Query(None),
+                                    min_lon: float = Query(None), max_lon: float = Query(None),
+                                    order_by_distance: bool = Query(False),
+                                    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT), after: int = Query(None),
+                                    db: AsyncSession = Depends(get_read_db)):
     """
         Получить организации по географической области.
 
-        Этот метод возвращает список организаций, находящихся в пределах указанной области.
+        Этот метод возвращает постранично организации, находящиеся в пределах указанной области.
         Область может быть задана либо радиусом вокруг точки, либо прямоугольником.
 
+        Нужно задать radius или все четыре границы прямоугольника, иначе возвращается ошибка 400.
+
         - **lat**: Широта центра области.
         - **lon**: Долгота центра области.
         - **radius**: Радиус поиска в километрах (опционально).
@@ -39,29 +68,99 @@ def get_organizations_by_area(lat: float, lon: float, radius: float = Query(None
         - **max_lat**: Максимальная широта (опционально).
         - **min_lon**: Минимальная долгота (опционально).
         - **max_lon**: Максимальная долгота (опционально).
+        - **order_by_distance**: Отсортировать результат по удалению от точки (lat, lon).
+        - **limit**: Максимальное количество записей на странице.
+        - **after**: Курсор — значение `next_cursor` из предыдущей страницы (опционально).
 
-        Возвращает список организаций.
+        Возвращает страницу организаций с расстоянием от их здания до точки (lat, lon) в километрах
+        и курсор следующей страницы.
         """
-    return OrganizationService.get_organizations_by_area(lat=lat, lon=lon, radius=radius, min_lat=min_lat,
-                                                         max_lat=max_lat, min_lon=min_lon, max_lon=max_lon, db=db)
+    page = await OrganizationService.get_organizations_by_area(lat=lat, lon=lon, radius=radius, min_lat=min_lat,
+                                                               max_lat=max_lat, min_lon=min_lon, max_lon=max_lon,
+                                                               order_by_distance=order_by_distance, limit=limit,
+                                                               after=after, db=db)
+    return respond(request, Page[OrganizationWithDistanceDTO], page)
 
 
 @router.get("/organizations/by-name", response_model=list[OrganizationDTO], tags=['organizations'])
-def search_organization_by_name(name: str, db: Session = Depends(get_db)):
+async def search_organization_by_name(request: Request, name: str,
+                                      limit: int = Query(OrganizationService.DEFAULT_SEARCH_LIMIT, ge=1, le=100),
+                                      prefix: bool = Query(False), db: AsyncSession = Depends(get_read_db)):
     """
         Поиск организаций по названию.
 
-        Этот метод возвращает список организаций, название которых содержит указанную строку.
+        Этот метод возвращает организации, название которых содержит указанную строку
+        или похоже на неё (с учетом опечаток), отсортированные по степени похожести.
 
         - **name**: Строка для поиска в названиях организаций.
+        - **limit**: Максимальное количество организаций в ответе.
+        - **prefix**: Искать только названия, начинающиеся с указанной строки (подсказки при вводе);
+          результат упорядочен по названию.
 
         Возвращает список организаций.
         """
-    return OrganizationService.search_organization_by_name(name=name, db=db)
+    orgs = await OrganizationService.search_organization_by_name(name=name, db=db, limit=limit, prefix=prefix)
+    return respond(request, list[OrganizationDTO], orgs)
+
+
+@router.get("/organizations/search", response_model=list[OrganizationWithDistanceDTO], tags=['organizations'])
+async def search_organizations(request: Request, lat: float = Query(None), lon: float = Query(None),
+                               radius: float = Query(None, gt=0),
+                               min_lat: float = Query(None), max_lat: float = Query(None),
+                               min_lon: float = Query(None), max_lon: float = Query(None),
+                               activity_id: int = Query(None), activity_subtree: bool = Query(False),
+                               name: str = Query(None, min_length=1), prefix: bool = Query(False),
+                               order_by_distance: bool = Query(False),
+                               limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+                               db: AsyncSession = Depends(get_read_db)):
+    """
+        Поиск организаций по любому сочетанию фильтров.
+
+        Этот метод объединяет поиск по области, по деятельности и по названию в одном запросе к базе данных:
+        возвращаются организации, подходящие под все переданные фильтры.
+        Расстояние считается по сфере, как в `/organizations/by-area` для прямоугольника.
+
+        - **lat**, **lon**: Точка, от которой считается расстояние (обязательны для `radius` и `order_by_distance`).
+        - **radius**: Радиус поиска в километрах (опционально).
+        - **min_lat**, **max_lat**, **min_lon**, **max_lon**: Прямоугольник, задаются вместе (опционально).
+        - **activity_id**: ID деятельности (опционально).
+        - **activity_subtree**: Учитывать и дочерние деятельности.
+        - **name**: Строка для поиска в названиях организаций (опционально).
+        - **prefix**: Искать только названия, начинающиеся с `name`.
+        - **order_by_distance**: Отсортировать результат по удалению от точки (lat, lon);
+          иначе по названию при `prefix`, по похожести названия, если задан `name`, или по ID.
+        - **limit**: Максимальное количество организаций в ответе.
+
+        При неполном наборе координат возвращается ошибка 400.
+
+        Возвращает список организаций с расстоянием до точки (lat, lon), если она задана.
+        """
+    orgs = await OrganizationService.search_organizations(
+        db=db, lat=lat, lon=lon, radius=radius, min_lat=min_lat, max_lat=max_lat, min_lon=min_lon, max_lon=max_lon,
+        activity_id=activity_id, activity_subtree=activity_subtree, name=name, prefix=prefix,
+        order_by_distance=order_by_distance, limit=limit)
+    return respond(request, list[OrganizationWithDistanceDTO], orgs)
+
+
+@router.get("/organizations/export", tags=['organizations'])
+async def export_organizations(request: Request, format: Literal["ndjson", "json"] = Query("ndjson")):
+    """
+        Выгрузить все организации потоком.
+
+        Этот метод отдает все организации по мере чтения из базы данных, пачками через серверный курсор,
+        поэтому потребление памяти не зависит от размера таблицы.
+
+        - **format**: `ndjson` — одна организация на строку, `json` — JSON-массив.
+
+        Возвращает поток организаций.
+        """
+    media_type = "application/x-ndjson" if format == "ndjson" else "application/json"
+    rows = OrganizationService.export_organizations(fmt=format, session_factory=read_sessionmaker(request))
+    return StreamingResponse(rows, media_type=media_type)
 
 
 @router.get("/organizations/{org_id}", response_model=OrganizationDTO, tags=['organizations'])
-def get_organization_by_id(org_id: int, db: Session = Depends(get_db)):
+async def get_organization_by_id(request: Request, org_id: int, db: AsyncSession = Depends(get_read_db)):
     """
         Получить организацию по ID.
 
@@ -72,23 +171,28 @@ def get_organization_by_id(org_id: int, db: Session = Depends(get_db)):
 
         Возвращает организацию.
         """
-    return OrganizationService.get_organization_by_id(org_id=org_id, db=db)
+    return respond(request, OrganizationDTO, await OrganizationService.get_organization_by_id(org_id=org_id, db=db))
 
 
-@router.get("/organizations/", response_model=list[OrganizationDTO], tags=['organizations'])
-def list_organizations(db: Session = Depends(get_db)):
+@router.get("/organizations/", response_model=Page[OrganizationDTO], tags=['organizations'])
+async def list_organizations(request: Request, limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+                             after: int = Query(None), db: AsyncSession = Depends(get_read_db)):
     """
         Получить список всех организаций.
 
-        Этот метод возвращает список всех организаций, зарегистрированных в системе.
+        Этот метод возвращает список всех организаций, зарегистрированных в системе, постранично.
 
-        Возвращает список организаций.
+        - **limit**: Максимальное количество записей на странице.
+        - **after**: Курсор — значение `next_cursor` из предыдущей страницы (опционально).
+
+        Возвращает страницу организаций и курсор следующей страницы.
         """
-    return OrganizationService.list_organizations(db=db)
+    return respond(request, Page[OrganizationDTO],
+                   await OrganizationService.list_organizations(db=db, limit=limit, after=after))
 
 
 @router.delete("/organizations/{org_id}", tags=['organizations'])
-def delete_organization(org_id: int, db: Session = Depends(get_db)):
+async def delete_organization(org_id: int, db: AsyncSession = Depends(get_db)):
     """
         Удалить организацию по ID.
 
@@ -99,47 +203,71 @@ def delete_organization(org_id: int, db: Session = Depends(get_db)):
 
         Возвращает сообщение об успешном удалении.
         """
-    return OrganizationService.delete_organization(org_id=org_id, db=db)
+    return await OrganizationService.delete_organization(org_id=org_id, db=db)
 
 
-@router.get("/organizations/by-building/{building_id}", response_model=list[OrganizationDTO], tags=['organizations'])
-def get_organizations_by_building(building_id: int, db: Session = Depends(get_db)):
+@router.get("/organizations/by-building/{building_id}", response_model=Page[OrganizationDTO], tags=['organizations'])
+async def get_organizations_by_building(request: Request, building_id: int,
+                                        limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT), after: int = Query(None),
+                                        db: AsyncSession = Depends(get_read_db)):
     """
         Получить организации по ID здания.
 
         Этот метод возвращает список организаций, связанных с указанным зданием.
 
         - **building_id**: ID здания.
+        - **limit**: Максимальное количество записей на странице.
+        - **after**: Курсор — значение `next_cursor` из предыдущей страницы (опционально).
 
-        Возвращает список организаций.
+        Ответ кэшируется; при совпадении заголовка `If-None-Match` с ETag возвращается 304.
+
+        Возвращает страницу организаций и курсор следующей страницы.
         """
-    return OrganizationService.get_organizations_by_building(building_id=building_id, db=db)
+    return await response_cache.respond(
+        request, db, ORGANIZATION_TAGS, Page[OrganizationDTO],
+        lambda: OrganizationService.get_organizations_by_building(building_id=building_id, db=db, limit=limit,
+                                                                  after=after))
 
 
-@router.get("/organizations/by-activity/{activity_id}", response_model=list[OrganizationDTO], tags=['organizations'])
-def get_organizations_by_activity(activity_id: int, db: Session = Depends(get_db)):
+@router.get("/organizations/by-activity/{activity_id}", response_model=Page[OrganizationDTO], tags=['organizations'])
+async def get_organizations_by_activity(request: Request, activity_id: int,
+                                        limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT), after: int = Query(None),
+                                        db: AsyncSession = Depends(get_read_db)):
     """
         Получить организации по ID активности.
 
         Этот метод возвращает список организаций, связанных с указанной активностью.
 
         - **activity_id**: ID активности.
+        - **limit**: Максимальное количество записей на странице.
+        - **after**: Курсор — значение `next_cursor` из предыдущей страницы (опционально).
 
-        Возвращает список организаций.
+        Возвращает страницу организаций и курсор следующей страницы.
         """
-    return OrganizationService.get_organizations_by_activity(activity_id=activity_id, db=db)
+    orgs = await OrganizationService.get_organizations_by_activity(activity_id=activity_id, db=db, limit=limit,
+                                                                   after=after)
+    return respond(request, Page[OrganizationDTO], orgs)
 
 
-@router.get("/organizations/by-activity-tree/{activity_id}", response_model=list[OrganizationDTO], tags=['organizations'])
-def get_organizations_by_activity_tree(activity_id: int, db: Session = Depends(get_db)):
+@router.get("/organizations/by-activity-tree/{activity_id}", response_model=Page[OrganizationDTO], tags=['organizations'])
+async def get_organizations_by_activity_tree(request: Request, activity_id: int,
+                                             limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT), after: int = Query(None),
+                                             db: AsyncSession = Depends(get_read_db)):
     """
         Получить организации по дереву активностей.
 
         Этот метод возвращает список организаций, связанных с указанной активностью и её дочерними активностями.
 
         - **activity_id**: ID активности.
+        - **limit**: Максимальное количество записей на странице.
+        - **after**: Курсор — значение `next_cursor` из предыдущей страницы (опционально).
         - **db**: Сессия базы данных.
 
-        Возвращает список организаций.
+        Ответ кэшируется; при совпадении заголовка `If-None-Match` с ETag возвращается 304.
+
+        Возвращает страницу организаций и курсор следующей страницы.
         """
-    return OrganizationService.get_organizations_by_activity_tree(activity_id=activity_id, db=db)
+    return await response_cache.respond(
+        request, db, ORGANIZATION_TAGS, Page[OrganizationDTO],
+        lambda: OrganizationService.get_organizations_by_activity_tree(activity_id=activity_id, db=db,
+                                                                       limit=limit, after=after))
@@ -0,0 +1,62 @@
+from fastapi import APIRouter, Depends, Path, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.aggregates import TILE_MAX_ZOOM
+from app.database import get_read_db
+from app.dto.stats import ActivityCount as ActivityCountDTO, TileCount as TileCountDTO
+from app.serialization import respond
+from app.services import stats as StatsService
+
+router = APIRouter()
+
+
+@router.get("/stats/activities", response_model=list[ActivityCountDTO], tags=['stats'])
+async def get_activity_counts(request: Request, db: AsyncSession = Depends(get_read_db)):
+    """
+        Получить число организаций по деятельностям.
+
+        Этот метод возвращает для каждой деятельности число организаций, связанных с ней
+        или с любой из её дочерних деятельностей; организация считается один раз.
+        Значения берутся из счетчиков, которые обновляются при создании и удалении организаций и деятельностей.
+
+        Возвращает список счетчиков, упорядоченный по ID деятельности.
+        """
+    return respond(request, list[ActivityCountDTO], await StatsService.get_activity_counts(db=db))
+
+
+@router.get("/stats/activities/{activity_id}", response_model=ActivityCountDTO, tags=['stats'])
+async def get_activity_count(request: Request, activity_id: int, db: AsyncSession = Depends(get_read_db)):
+    """
+        Получить число организаций по дереву деятельности.
+
+        Этот метод возвращает число организаций, связанных с указанной деятельностью или её дочерними деятельностями.
+        Если деятельность не найдена, возвращается ошибка 404.
+
+        - **activity_id**: ID деятельности.
+
+        Возвращает счетчик деятельности.
+        """
+    return respond(request, ActivityCountDTO, await StatsService.get_activity_count(activity_id=activity_id, db=db))
+
+
+@router.get("/stats/tiles/{zoom}", response_model=list[TileCountDTO], tags=['stats'])
+async def get_tile_counts(request: Request, zoom: int = Path(..., ge=0, le=TILE_MAX_ZOOM),
+                          min_lat: float = Query(None), max_lat: float = Query(None),
+                          min_lon: float = Query(None), max_lon: float = Query(None),
+                          db: AsyncSession = Depends(get_read_db)):
+    """
+        Получить плотность организаций по ячейкам карты.
+
+        Этот метод возвращает число организаций в каждом непустом тайле карты (Web Mercator, как z/x/y
+        у тайловых серверов) указанного уровня. Значения берутся из счетчиков, которые обновляются
+        при создании и удалении организаций.
+
+        - **zoom**: Уровень тайлов.
+        - **min_lat**, **max_lat**, **min_lon**, **max_lon**: Вернуть только тайлы, пересекающие прямоугольник;
+          задаются вместе (опционально).
+
+        Возвращает список непустых тайлов с числом организаций.
+        """
+    tiles = await StatsService.get_tile_counts(zoom=zoom, db=db, min_lat=min_lat, max_lat=max_lat,
+                                               min_lon=min_lon, max_lon=max_lon)
+    return respond(request, list[TileCountDTO], tiles)
@@ -0,0 +1,31 @@
+from fastapi import APIRouter, Depends, Path, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import get_read_db
+from app.dto.tile import Tile as TileDTO
+from app.response_cache import BUILDINGS, ORGANIZATIONS, response_cache
+from app.services import tile as TileService
+
+router = APIRouter()
+
+
+@router.get("/tiles/{zoom}/{x}/{y}", response_model=TileDTO, tags=['tiles'])
+async def get_tile(request: Request, zoom: int = Path(..., ge=0, le=TileService.MAX_TILE_ZOOM),
+                   x: int = Path(..., ge=0), y: int = Path(..., ge=0), db: AsyncSession = Depends(get_read_db)):
+    """
+        Получить здания тайла карты.
+
+        Этот метод возвращает содержимое тайла `zoom/x/y` карты Web Mercator (нумерация как у тайловых серверов).
+        Если зданий в тайле много, возвращаются кластеры — не больше 64 — с числом зданий и организаций
+        и центром кластера; иначе — сами здания с числом организаций в каждом.
+        Кластеры строятся по заранее посчитанным тайлам, поэтому размер ответа и время не зависят от масштаба.
+
+        - **zoom**: Уровень тайла.
+        - **x**, **y**: Номер тайла; должны быть меньше `2 ** zoom`.
+
+        Ответ кэшируется; при совпадении заголовка `If-None-Match` с ETag возвращается 304.
+
+        Возвращает тайл с кластерами или зданиями.
+        """
+    return await response_cache.respond(request, db, (BUILDINGS, ORGANIZATIONS), TileDTO,
+                                        lambda: TileService.get_tile(zoom=zoom, x=x, y=y, db=db))
@@ -0,0 +1,62 @@
+"""
+Быстрая сериализация ответов.
+
+FastAPI по response_model проверяет возвращенные ORM-объекты, превращает результат в dict и кодирует его
+стандартным json. Здесь модель проверяется один раз, а байты ответа пишет сразу pydantic-core (Rust),
+без промежуточного dict.
+"""
+from functools import lru_cache
+from typing import Any
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from pydantic_core import to_json
+
+try:
+    import msgpack
+except ImportError:
+    # msgpack необязателен: без него всегда отдается JSON
+    msgpack = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+MSGPACK_TYPES = (MSGPACK, "application/x-msgpack")
+
+
+class FastJSONResponse(JSONResponse):
+    """Класс ответа по умолчанию: кодирует результат через pydantic-core вместо json.dumps."""
+
+    def render(self, content: Any) -> bytes:
+        return to_json(content)
+
+
+@lru_cache
+def adapter(response_model: Any) -> TypeAdapter:
+    # Схема валидации и сериализатор строятся один раз на модель ответа
+    return TypeAdapter(response_model)
+
+
+def negotiate(request: Request) -> str:
+    """MessagePack, если клиент просит его в Accept и пакет msgpack установлен; иначе JSON."""
+    if msgpack is not None and any(media in request.headers.get("accept", "") for media in MSGPACK_TYPES):
+        return MSGPACK
+    return JSON
+
+
+def render(response_model: Any, content: Any, media_type: str = JSON) -> bytes:
+    model_adapter = adapter(response_model)
+    value = model_adapter.validate_python(content, from_attributes=True)
+    if media_type == MSGPACK:
+        return msgpack.packb(model_adapter.dump_python(value, mode="json"))
+    return model_adapter.dump_json(value)
+
+
+def respond(request: Request, response_model: Any, content: Any) -> Response:
+    """
+    Ответ по response_model в обход сериализации FastAPI.
+
+    response_model в декораторе маршрута по-прежнему описывает схему для документации.
+    """
+    media_type = negotiate(request)
+    return Response(render(response_model, content, media_type), media_type=media_type, headers={"Vary": "Accept"})
@@ -1,42 +1,128 @@
+from typing import Optional
+
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, insert, literal, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.dto.activity import ActivityCreate
-from app.models import Activity
+from app.activity_cache import CACHE_NAME, activity_cache
+from app.aggregates import recount_activities
+from app.bulk import insert_rows
+from app.cache_versions import bump_version
+from app.dto.activity import MAX_ACTIVITY_LEVEL, ActivityCreate, activity_depths
+from app.dto.bulk import BulkError, BulkResult
+from app.models import Activity, activity_closure, organization_activity
+from app.pagination import DEFAULT_LIMIT, paginate
+from app.read_model import activities as fetch_activities, select_activities
+from app.response_cache import response_cache
 
 
-def create_activity(activity: ActivityCreate, db: Session):
+async def create_activity(activity: ActivityCreate, db: AsyncSession):
     if activity.parent_id:
-        parent_exists = db.query(Activity).filter(Activity.id == activity.parent_id).first()
-        if not parent_exists or activity.parent_id == 0:
-            raise HTTPException(status_code=404, detail=f"Parent activity with ID {activity.parent_id} does not exist")
-
-        ActivityCreate.validate_parent_level(db, activity.parent_id)
+        await ActivityCreate.validate_parent_level(db, activity.parent_id)
 
     db_activity = Activity(**activity.dict())
     db.add(db_activity)
-    db.commit()
-    db.refresh(db_activity)
+    await db.flush()
+
+    closure = activity_closure.c
+    await db.execute(insert(activity_closure).values(ancestor_id=db_activity.id, descendant_id=db_activity.id,
+                                                     depth=0))
+    if db_activity.parent_id:
+        await db.execute(insert(activity_closure).from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            select(closure.ancestor_id, literal(db_activity.id), closure.depth + 1)
+            .where(closure.descendant_id == db_activity.parent_id)
+        ))
+    await bump_version(db, CACHE_NAME)
+    await db.commit()
+    activity_cache.invalidate()
+    await response_cache.invalidate(CACHE_NAME)
+    await db.refresh(db_activity)
     return db_activity
 
 
-def read_activity(activity_id: int, db: Session):
-    activity = db.query(Activity).filter(Activity.id == activity_id).first()
-    if activity is None:
+async def create_activities(activities: list[ActivityCreate], db: AsyncSession):
+    # Родители проверяются одним запросом (или по кэшу дерева); ссылки на записи из той же пачки не поддерживаются
+    depths = await activity_depths(db, {activity.parent_id for activity in activities if activity.parent_id is not None})
+    ids, errors, valid = [None] * len(activities), [], []
+    for index, activity in enumerate(activities):
+        if activity.parent_id is not None:
+            parent_depth = depths.get(activity.parent_id)
+            if parent_depth is None:
+                errors.append(BulkError(index=index,
+                                        detail=f"Parent activity with ID {activity.parent_id} does not exist"))
+                continue
+            if parent_depth + 1 >= MAX_ACTIVITY_LEVEL:
+                errors.append(BulkError(index=index, detail="The maximum level of nesting of activities is 3 levels"))
+                continue
+        valid.append(index)
+    if not valid:
+        return BulkResult(ids=ids, errors=errors)
+
+    saved = (await db.execute(
+        insert(Activity.__table__).returning(Activity.id, sort_by_parameter_order=True),
+        [activities[index].model_dump() for index in valid],
+    )).scalars().all()
+    closure = activity_closure.c
+    await insert_rows(db, activity_closure,
+                      [{"ancestor_id": activity_id, "descendant_id": activity_id, "depth": 0} for activity_id in saved])
+    await db.execute(insert(activity_closure).from_select(
+        ["ancestor_id", "descendant_id", "depth"],
+        select(closure.ancestor_id, Activity.id, closure.depth + 1)
+        .join(Activity, closure.descendant_id == Activity.parent_id)
+        .where(Activity.id.in_(saved))
+    ))
+    await bump_version(db, CACHE_NAME)
+    await db.commit()
+    activity_cache.invalidate()
+    await response_cache.invalidate(CACHE_NAME)
+    for index, activity_id in zip(valid, saved):
+        ids[index] = activity_id
+    return BulkResult(ids=ids, errors=errors)
+
+
+async def read_activity(activity_id: int, db: AsyncSession):
+    found = await fetch_activities(db, select_activities().where(Activity.id == activity_id))
+    if not found:
         raise HTTPException(status_code=404, detail="Activity not found")
-    return activity
+    return found[0]
 
 
-def list_activities(db: Session):
-    return db.query(Activity).all()
+async def list_activities(db: AsyncSession, limit: int = DEFAULT_LIMIT, after: Optional[int] = None):
+    return await paginate(db, select_activities(), Activity.id, limit, after, fetch_activities)
 
 
-def delete_activity(activity_id: int, db: Session):
-    activity = db.query(Activity).filter(Activity.id == activity_id).first()
-    if activity is None:
+async def delete_activity(activity_id: int, db: AsyncSession):
+    # Пути к деятельности из замыкания: пара (id, id) с depth = 0 есть у каждой существующей деятельности,
+    # родитель — предок с depth = 1. Запись занимает постоянное число команд, без загрузки связей ORM
+    closure = activity_closure.c
+    paths = dict((await db.execute(
+        select(closure.ancestor_id, closure.depth).where(closure.descendant_id == activity_id)
+    )).tuples().all())
+    if activity_id not in paths:
         raise HTTPException(status_code=404, detail="Activity not found")
-    db.query(Activity).filter(Activity.parent_id == activity_id).update({"parent_id": activity.parent_id})
+    parent_id = next((ancestor_id for ancestor_id, depth in paths.items() if depth == 1), None)
+    ancestor_ids = [ancestor_id for ancestor_id in paths if ancestor_id != activity_id]
+    await db.execute(update(Activity).where(Activity.parent_id == activity_id).values(parent_id=parent_id))
+
+    # Потомки поднимаются на уровень выше: пути от предков удаляемой деятельности к её потомкам укорачиваются на 1
+    ancestors = select(closure.ancestor_id).where(closure.descendant_id == activity_id, closure.depth > 0)
+    descendants = select(closure.descendant_id).where(closure.ancestor_id == activity_id, closure.depth > 0)
+    await db.execute(
+        update(activity_closure)
+        .where(closure.ancestor_id.in_(ancestors), closure.descendant_id.in_(descendants))
+        .values(depth=closure.depth - 1)
+    )
+    await db.execute(activity_closure.delete().where(
+        (closure.ancestor_id == activity_id) | (closure.descendant_id == activity_id)
+    ))
 
-    db.delete(activity)
-    db.commit()
+    await db.execute(delete(organization_activity).where(organization_activity.c.activity_id == activity_id))
+    await db.execute(delete(Activity).where(Activity.id == activity_id))
+    # Вместе с деятельностью удалены её связи с организациями: предки могли потерять организации
+    await recount_activities(db, ancestor_ids + [activity_id])
+    await bump_version(db, CACHE_NAME)
+    await db.commit()
+    activity_cache.invalidate()
+    await response_cache.invalidate(CACHE_NAME)
     return {"detail": "Activity deleted"}
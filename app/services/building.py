@@ -1,49 +1,139 @@
+import math
+from typing import Optional
+
 from fastapi import HTTPException
-from geopy.distance import distance
-from sqlalchemy import and_
-from sqlalchemy.orm import Session
+from sqlalchemy import ColumnElement, Float, and_, case, exists, func, or_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app import config
+from app.aggregates import count_buildings
+from app.cache_versions import bump_version
 from app.dto.building import BuildingCreate
-from app.models import Building
+from app.dto.bulk import BulkResult
+from app.geo import EARTH_RADIUS_KM, bounding_box, haversine_km
+from app.models import Building, Organization
+from app.pagination import DEFAULT_LIMIT, paginate
+from app.read_model import buildings as fetch_buildings, select_buildings
+from app.response_cache import BUILDINGS, response_cache
+from app.spatial_index import building_index
 
 
-def create_building(building: BuildingCreate, db: Session):
+async def create_building(building: BuildingCreate, db: AsyncSession):
     db_building = Building(**building.dict())
     db.add(db_building)
-    db.commit()
-    db.refresh(db_building)
+    await db.flush()
+    await count_buildings(db, Building.id == db_building.id, 1)
+    version = await bump_version(db, BUILDINGS)
+    await db.commit()
+    await response_cache.invalidate(BUILDINGS)
+    await db.refresh(db_building)
+    building_index.update(version, added=[(db_building.id, db_building.latitude, db_building.longitude)])
     return db_building
 
 
-def read_building(building_id: int, db: Session):
-    building = db.query(Building).filter(Building.id == building_id).first()
-    if building is None:
+async def upsert_buildings(buildings: list[BuildingCreate], db: AsyncSession):
+    # Повторяющиеся в пачке адреса схлопываются (побеждает последняя запись): ON CONFLICT DO UPDATE
+    # не может обновить одну строку дважды за команду
+    rows = {building.address: building.model_dump() for building in buildings}
+    if not rows:
+        return BulkResult(ids=[], errors=[])
+    statement = pg_insert(Building.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=[Building.address],
+        set_={"latitude": statement.excluded.latitude, "longitude": statement.excluded.longitude},
+    ).returning(Building.id, Building.address, Building.latitude, Building.longitude)
+    # Перенесенные здания вместе с их организациями переходят в другие тайлы
+    await count_buildings(db, Building.address.in_(rows), -1)
+    saved = (await db.execute(statement, list(rows.values()))).all()
+    await count_buildings(db, Building.address.in_(rows), 1)
+    version = await bump_version(db, BUILDINGS)
+    await db.commit()
+    await response_cache.invalidate(BUILDINGS)
+    building_index.update(version, added=[(row.id, row.latitude, row.longitude) for row in saved])
+    ids = {row.address: row.id for row in saved}
+    return BulkResult(ids=[ids[building.address] for building in buildings], errors=[])
+
+
+async def read_building(building_id: int, db: AsyncSession):
+    found = await fetch_buildings(db, select_buildings().where(Building.id == building_id))
+    if not found:
         raise HTTPException(status_code=404, detail="Building not found")
-    return building
+    return found[0]
 
 
-def list_buildings(db: Session):
-    return db.query(Building).all()
+async def list_buildings(db: AsyncSession, limit: int = DEFAULT_LIMIT, after: Optional[int] = None):
+    return await paginate(db, select_buildings(), Building.id, limit, after, fetch_buildings)
 
 
-def delete_building(building_id: int, db: Session):
-    building = db.query(Building).filter(Building.id == building_id).first()
+async def delete_building(building_id: int, db: AsyncSession):
+    building = await db.get(Building, building_id)
     if building is None:
         raise HTTPException(status_code=404, detail="Building not found")
-    db.delete(building)
-    db.commit()
+    # Организация без здания не может быть показана: сначала их нужно перенести или удалить
+    if (await db.execute(select(exists().where(Organization.building_id == building_id)))).scalar():
+        raise HTTPException(status_code=409, detail="Building has organizations")
+    await count_buildings(db, Building.id == building_id, -1)
+    await db.delete(building)
+    version = await bump_version(db, BUILDINGS)
+    await db.commit()
+    await response_cache.invalidate(BUILDINGS)
+    building_index.update(version, removed=[building_id])
     return {"detail": "Building deleted"}
 
 
-def get_buildings_by_area(lat: float, lon: float, radius: float, min_lat: float, max_lat: float, min_lon: float,
-                          max_lon: float, db: Session):
-    query = db.query(Building)
-    if radius:
-        buildings = db.query(Building).all()
-        buildings_in_radius = [b for b in buildings if distance((lat, lon), (b.latitude, b.longitude)).km <= radius]
-        query = query.filter(Building.id.in_([b.id for b in buildings_in_radius]))
-    elif all([min_lat, max_lat, min_lon, max_lon]):
-        query = query.filter(
-            and_(Building.latitude.between(min_lat, max_lat), Building.longitude.between(min_lon, max_lon))
-        )
-    return query.all()
+def bounding_box_filter(lat: float, lon: float, radius: float):
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius)
+    if min_lon <= max_lon:
+        lon_filter = Building.longitude.between(min_lon, max_lon)
+    else:
+        lon_filter = or_(Building.longitude >= min_lon, Building.longitude <= max_lon)
+    return and_(Building.latitude.between(min_lat, max_lat), lon_filter)
+
+
+def distance_km(lat: float, lon: float):
+    # Расстояние по сфере от точки (lat, lon) до здания в SQL; та же формула, что в geo.haversine_km
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lat2, lon2 = func.radians(Building.latitude, type_=Float), func.radians(Building.longitude, type_=Float)
+    sin_lat, sin_lon = func.sin((lat2 - lat1) / 2, type_=Float), func.sin((lon2 - lon1) / 2, type_=Float)
+    h = sin_lat * sin_lat + math.cos(lat1) * func.cos(lat2, type_=Float) * sin_lon * sin_lon
+    return 2 * EARTH_RADIUS_KM * func.asin(func.sqrt(case((h > 1, 1.0), else_=h), type_=Float), type_=Float)
+
+
+async def area_filter(lat: float, lon: float, radius: Optional[float], min_lat: Optional[float],
+                      max_lat: Optional[float], min_lon: Optional[float], max_lon: Optional[float],
+                      building_id: ColumnElement, db: AsyncSession):
+    """
+    Условие запросов by-area: здание (building_id — колонка с его ID) лежит в радиусе radius км от (lat, lon)
+    или в прямоугольнике. Со включенным SPATIAL_INDEX_ENABLED здания берутся из сетки в памяти,
+    иначе и когда их больше SPATIAL_INDEX_MAX_IDS — фильтр по координатам выполняется в SQL.
+    """
+    has_bbox = all(value is not None for value in (min_lat, max_lat, min_lon, max_lon))
+    if radius is None and not has_bbox:
+        raise HTTPException(status_code=400, detail="radius or min_lat, max_lat, min_lon and max_lon are required")
+    if radius is not None:
+        if config.SPATIAL_INDEX_ENABLED:
+            distances = await building_index.distances_in_radius(lat, lon, radius, db)
+            if distances is not None:
+                return building_id.in_(distances)
+        # Прямоугольник отсекает кандидатов по индексу координат, расстояние уточняет границу круга
+        return and_(bounding_box_filter(lat, lon, radius), distance_km(lat, lon) <= radius)
+    if config.SPATIAL_INDEX_ENABLED:
+        building_ids = await building_index.ids_in_bbox(min_lat, max_lat, min_lon, max_lon, db)
+        if building_ids is not None:
+            return building_id.in_(building_ids)
+    return and_(Building.latitude.between(min_lat, max_lat), Building.longitude.between(min_lon, max_lon))
+
+
+async def get_buildings_by_area(lat: float, lon: float, radius: Optional[float], min_lat: Optional[float],
+                                max_lat: Optional[float], min_lon: Optional[float], max_lon: Optional[float],
+                                db: AsyncSession, order_by_distance: bool = False, limit: int = DEFAULT_LIMIT,
+                                after: Optional[int] = None):
+    condition = await area_filter(lat, lon, radius, min_lat, max_lat, min_lon, max_lon, Building.id, db)
+    sort_key = distance_km(lat, lon) if order_by_distance else None
+    page = await paginate(db, select_buildings().where(condition), Building.id, limit, after, fetch_buildings,
+                          sort_key)
+    buildings = page["items"]
+    for building, distance in zip(buildings, haversine_km(lat, lon, [(b.latitude, b.longitude) for b in buildings])):
+        building.distance = distance
+    return page
@@ -1,86 +1,270 @@
-from typing import Type
+from typing import AsyncIterator, Optional
 
 from fastapi import HTTPException
-from geopy.distance import distance
-from sqlalchemy import and_
-from sqlalchemy.orm import Session
+from sqlalchemy import Select, func, insert, literal, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import contains_eager, selectinload
 
-from app.dto.organization import OrganizationCreate
-from app.models import Activity, Building, Organization
+from app import config
+from app.activity_cache import activity_cache
+from app.aggregates import count_organizations
+from app.bulk import insert_rows
+from app.cache_versions import bump_version
+from app.dto.bulk import BulkError, BulkResult
+from app.dto.organization import Organization as OrganizationDTO, OrganizationCreate
+from app.geo import haversine_km
+from app.models import Activity, Building, Organization, activity_closure, organization_activity
+from app.pagination import DEFAULT_LIMIT, paginate
+from app.read_model import organizations as fetch_organizations, select_organization_ids
+from app.response_cache import ORGANIZATIONS, response_cache
+from app.services.building import area_filter, bounding_box_filter, distance_km
 
+EXPORT_BATCH_SIZE = 1000
+DEFAULT_SEARCH_LIMIT = 20
 
-def create_organization(org: OrganizationCreate, db: Session):
+
+def select_organizations() -> Select:
+    # ORM-загрузка для выгрузки; GET-запросы читают через app.read_model. Как и там, здание присоединяется
+    # внутренним соединением: организации без здания (building_id IS NULL) не выгружаются
+    return select(Organization).join(Organization.building) \
+        .options(contains_eager(Organization.building), selectinload(Organization.activities))
+
+
+async def create_organization(org: OrganizationCreate, db: AsyncSession):
     org_data = org.dict()
-    activity_ids = org_data.pop("activity_ids", [])
+    activity_ids = list(dict.fromkeys(org_data.pop("activity_ids", [])))
+
+    # Здание и все деятельности проверяются одним запросом, до любой записи
+    found = (await db.execute(
+        select(literal("building").label("kind"), Building.id).where(Building.id == org.building_id)
+        .union_all(select(literal("activity"), Activity.id).where(Activity.id.in_(activity_ids)))
+    )).all()
+    if ("building", org.building_id) not in found:
+        raise HTTPException(status_code=404, detail=f"Building with ID {org.building_id} not found")
+    missing = [activity_id for activity_id in activity_ids if ("activity", activity_id) not in found]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Activity with ID {missing[0]} not found")
 
     db_org = Organization(**org_data)
     db.add(db_org)
-    db.commit()
+    await db.flush()
+    await insert_rows(db, organization_activity,
+                      [{"organization_id": db_org.id, "activity_id": activity_id} for activity_id in activity_ids])
+    await count_organizations(db, [db_org.id], 1)
+    await bump_version(db, ORGANIZATIONS)
+    await db.commit()
+    await response_cache.invalidate(ORGANIZATIONS)
+    return await get_organization_by_id(db_org.id, db)
+
 
-    for activity_id in activity_ids:
-        activity = db.query(Activity).filter(Activity.id == activity_id).first()
-        if activity:
-            db_org.activities.append(activity)
+async def create_organizations(orgs: list[OrganizationCreate], db: AsyncSession):
+    # Ссылки всей пачки проверяются двумя запросами IN, запись — executemany в одной транзакции
+    building_ids = set((await db.execute(
+        select(Building.id).where(Building.id.in_({org.building_id for org in orgs}))
+    )).scalars())
+    activity_ids = set((await db.execute(
+        select(Activity.id).where(Activity.id.in_({activity_id for org in orgs for activity_id in org.activity_ids}))
+    )).scalars())
+
+    ids, errors, valid = [None] * len(orgs), [], []
+    for index, org in enumerate(orgs):
+        missing = sorted(set(org.activity_ids) - activity_ids)
+        if org.building_id not in building_ids:
+            errors.append(BulkError(index=index, detail=f"Building with ID {org.building_id} not found"))
+        elif missing:
+            errors.append(BulkError(index=index, detail=f"Activity with ID {missing[0]} not found"))
         else:
-            raise ValueError(f"Activity with ID {activity_id} not found")
+            valid.append(index)
+    if not valid:
+        return BulkResult(ids=ids, errors=errors)
 
-    db.commit()
-    db.refresh(db_org)
-    return db_org
+    saved = (await db.execute(
+        insert(Organization.__table__).returning(Organization.id, sort_by_parameter_order=True),
+        [orgs[index].model_dump(exclude={"activity_ids"}) for index in valid],
+    )).scalars().all()
+    links = [{"organization_id": org_id, "activity_id": activity_id}
+             for index, org_id in zip(valid, saved) for activity_id in set(orgs[index].activity_ids)]
+    await insert_rows(db, organization_activity, links)
+    await count_organizations(db, saved, 1)
+    await bump_version(db, ORGANIZATIONS)
+    await db.commit()
+    await response_cache.invalidate(ORGANIZATIONS)
+    for index, org_id in zip(valid, saved):
+        ids[index] = org_id
+    return BulkResult(ids=ids, errors=errors)
 
 
-def get_organization_by_id(org_id: int, db: Session) -> Type[Organization]:
-    org = db.query(Organization).filter(Organization.id == org_id).first()
-    if org is None:
+async def get_organization_by_id(org_id: int, db: AsyncSession):
+    found = await fetch_organizations(db, select_organization_ids().where(Organization.id == org_id))
+    if not found:
         raise HTTPException(status_code=404, detail="Building not found")
-    return org
+    return found[0]
+
 
+async def list_organizations(db: AsyncSession, limit: int = DEFAULT_LIMIT, after: Optional[int] = None):
+    return await paginate(db, select_organization_ids(), Organization.id, limit, after, fetch_organizations)
 
-def list_organizations(db: Session):
-    return db.query(Organization).all()
 
+async def export_organizations(fmt: str, session_factory: async_sessionmaker) -> AsyncIterator[bytes]:
+    # Сессия открывается внутри генератора: ответ отдается уже после закрытия зависимости get_db
+    async with session_factory() as db:
+        statement = select_organizations() \
+            .order_by(Organization.id) \
+            .execution_options(yield_per=EXPORT_BATCH_SIZE)
+        separator = b"\n" if fmt == "ndjson" else b","
+        first = True
+        if fmt == "json":
+            yield b"["
+        async for batch in (await db.stream(statement)).scalars().partitions():
+            chunk = separator.join(OrganizationDTO.model_validate(org).model_dump_json().encode() for org in batch)
+            if fmt == "ndjson":
+                chunk += separator
+            elif not first:
+                chunk = separator + chunk
+            first = False
+            yield chunk
+        if fmt == "json":
+            yield b"]"
 
-def delete_organization(org_id: int, db: Session):
-    org = db.query(Organization).filter(Organization.id == org_id).first()
+
+async def delete_organization(org_id: int, db: AsyncSession):
+    org = await db.get(Organization, org_id)
     if org is None:
         raise HTTPException(status_code=404, detail="Organization not found")
-    db.delete(org)
-    db.commit()
+    await count_organizations(db, [org_id], -1)
+    await db.delete(org)
+    await bump_version(db, ORGANIZATIONS)
+    await db.commit()
+    await response_cache.invalidate(ORGANIZATIONS)
     return {"detail": "Organization deleted"}
 
 
-def get_organizations_by_building(building_id: int, db: Session):
-    return db.query(Organization).filter(Organization.building_id == building_id).all()
+async def get_organizations_by_building(building_id: int, db: AsyncSession, limit: int = DEFAULT_LIMIT,
+                                        after: Optional[int] = None):
+    statement = select_organization_ids().where(Organization.building_id == building_id)
+    return await paginate(db, statement, Organization.id, limit, after, fetch_organizations)
+
+
+async def get_organizations_by_activity(activity_id: int, db: AsyncSession, limit: int = DEFAULT_LIMIT,
+                                        after: Optional[int] = None):
+    statement = select_organization_ids().where(Organization.activities.any(Activity.id == activity_id))
+    return await paginate(db, statement, Organization.id, limit, after, fetch_organizations)
+
+
+async def get_organizations_by_area(lat: float, lon: float, radius: Optional[float],
+                                    min_lat: Optional[float], max_lat: Optional[float],
+                                    min_lon: Optional[float], max_lon: Optional[float],
+                                    db: AsyncSession, order_by_distance: bool = False, limit: int = DEFAULT_LIMIT,
+                                    after: Optional[int] = None):
+    condition = await area_filter(lat, lon, radius, min_lat, max_lat, min_lon, max_lon, Organization.building_id, db)
+    columns = [Organization.id]
+    sort_key = None
+    if order_by_distance:
+        # Ключ сортировки — последняя колонка страницы (см. app.read_model.organizations)
+        sort_key = distance_km(lat, lon)
+        columns.append(sort_key.label("sort_key"))
+    statement = select(*columns).join_from(Organization, Building).where(condition)
+    page = await paginate(db, statement, Organization.id, limit, after, fetch_organizations, sort_key)
+    orgs = page["items"]
+    points = [(org.building.latitude, org.building.longitude) for org in orgs]
+    for org, distance in zip(orgs, haversine_km(lat, lon, points)):
+        org.distance = distance
+    return page
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _prefix_key(db: AsyncSession):
+    # lower(name) с побайтовым сравнением: по нему ix_organizations_name_lower_prefix отдает и совпадения
+    # префикса, и порядок (lower(name), id) без сортировки всех совпадений
+    key = func.lower(Organization.name)
+    return key.collate("C") if db.get_bind().dialect.name == "postgresql" else key
+
+
+def _name_condition(name: str, prefix: bool, db: AsyncSession):
+    pattern = _escape_like(name.lower())
+    if prefix:
+        return _prefix_key(db).like(f"{pattern}%", escape="\\")
+    # Подстрока или похожее по триграммам название (опечатки); оба условия обслуживает ix_organizations_name_trgm
+    return or_(Organization.name.ilike(f"%{pattern}%", escape="\\"), Organization.name.op("%")(name))
+
 
+async def search_organization_by_name(name: str, db: AsyncSession, limit: int = DEFAULT_SEARCH_LIMIT,
+                                      prefix: bool = False):
+    # Ключ сортировки — вторая колонка страницы: по префиксу — название по алфавиту,
+    # в нечетком поиске — похожесть (у похожих названий ключ меньше)
+    rank = _prefix_key(db) if prefix else -func.similarity(Organization.name, name)
+    statement = select(Organization.id, rank.label("rank")) \
+        .where(Organization.building_id.isnot(None), _name_condition(name, prefix, db)) \
+        .order_by(rank, Organization.id) \
+        .limit(limit)
+    return await fetch_organizations(db, statement)
 
-def get_organizations_by_activity(activity_id: int, db: Session):
-    return db.query(Organization).join(Organization.activities).filter(Activity.id == activity_id).all()
 
+async def _activity_organization_ids(activity_id: int, subtree: bool, db: AsyncSession) -> Select:
+    # ID организаций с деятельностью activity_id, а при subtree — и с любой из её потомков
+    links = organization_activity.c
+    if not subtree:
+        return select(links.organization_id).where(links.activity_id == activity_id)
+    if config.ACTIVITY_CACHE_ENABLED:
+        activity_ids = (await activity_cache.get(db)).subtree(activity_id)
+        return select(links.organization_id).where(links.activity_id.in_(activity_ids))
+    return select(links.organization_id) \
+        .join(activity_closure, activity_closure.c.descendant_id == links.activity_id) \
+        .where(activity_closure.c.ancestor_id == activity_id)
 
-def get_organizations_by_area(lat: float, lon: float, radius: float,
-                              min_lat: float, max_lat: float,
-                              min_lon: float, max_lon: float,
-                              db: Session):
-    query = db.query(Organization).join(Building)
-    if radius:
-        buildings = db.query(Building).all()
-        buildings_in_radius = [b.id for b in buildings if distance((lat, lon), (b.latitude, b.longitude)).km <= radius]
-        query = query.filter(Organization.building_id.in_(buildings_in_radius))
-    elif all([min_lat, max_lat, min_lon, max_lon]):
-        query = query.filter(
-            and_(Building.latitude.between(min_lat, max_lat), Building.longitude.between(min_lon, max_lon))
-        )
-    return query.all()
 
+async def get_organizations_by_activity_tree(activity_id: int, db: AsyncSession, limit: int = DEFAULT_LIMIT,
+                                             after: Optional[int] = None):
+    org_ids = await _activity_organization_ids(activity_id, True, db)
+    statement = select_organization_ids().where(Organization.id.in_(org_ids))
+    return await paginate(db, statement, Organization.id, limit, after, fetch_organizations)
 
-def search_organization_by_name(name: str, db: Session) -> list[Type[Organization]]:
-    return db.query(Organization).filter(Organization.name.ilike(f"%{name}%")).all()
 
+async def search_organizations(db: AsyncSession, lat: Optional[float] = None, lon: Optional[float] = None,
+                               radius: Optional[float] = None,
+                               min_lat: Optional[float] = None, max_lat: Optional[float] = None,
+                               min_lon: Optional[float] = None, max_lon: Optional[float] = None,
+                               activity_id: Optional[int] = None, activity_subtree: bool = False,
+                               name: Optional[str] = None, prefix: bool = False,
+                               order_by_distance: bool = False, limit: int = DEFAULT_LIMIT):
+    # Все фильтры — условия одного запроса: планировщик сам выбирает, с какого индекса начать
+    has_point = lat is not None and lon is not None
+    if (radius is not None or order_by_distance) and not has_point:
+        raise HTTPException(status_code=400, detail="lat and lon are required for radius search and distance ordering")
+    bbox = (min_lat, max_lat, min_lon, max_lon)
+    if any(value is not None for value in bbox) and not all(value is not None for value in bbox):
+        raise HTTPException(status_code=400, detail="min_lat, max_lat, min_lon and max_lon must be given together")
 
-def get_organizations_by_activity_tree(activity_id: int, db: Session):
-    def get_subactivities(activity_id):
-        subactivities = db.query(Activity).filter(Activity.parent_id == activity_id).all()
-        return [a.id for a in subactivities] + sum((get_subactivities(a.id) for a in subactivities), [])
+    conditions = []
+    if radius is not None:
+        # Прямоугольник отсекает кандидатов по индексу координат, расстояние уточняет границу круга
+        conditions += [bounding_box_filter(lat, lon, radius), distance_km(lat, lon) <= radius]
+    if min_lat is not None:
+        conditions += [Building.latitude.between(min_lat, max_lat), Building.longitude.between(min_lon, max_lon)]
+    if activity_id is not None:
+        conditions.append(Organization.id.in_(await _activity_organization_ids(activity_id, activity_subtree, db)))
+    if name:
+        conditions.append(_name_condition(name, prefix, db))
 
-    all_activity_ids = [activity_id] + get_subactivities(activity_id)
-    return db.query(Organization).join(Organization.activities).filter(Activity.id.in_(all_activity_ids)).all()
+    if order_by_distance:
+        sort_key = distance_km(lat, lon)
+    elif name and prefix:
+        sort_key = _prefix_key(db)
+    elif name:
+        sort_key = -func.similarity(Organization.name, name)
+    else:
+        sort_key = Organization.id
+    statement = select(Organization.id, sort_key.label("sort_key")) \
+        .join(Building) \
+        .where(*conditions) \
+        .order_by(sort_key, Organization.id) \
+        .limit(limit)
+    orgs = await fetch_organizations(db, statement)
+    if has_point:
+        points = [(org.building.latitude, org.building.longitude) for org in orgs]
+        for org, distance in zip(orgs, haversine_km(lat, lon, points)):
+            org.distance = distance
+    return orgs
@@ -0,0 +1,46 @@
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.geo import tile
+from app.models import Activity, activity_organization_counts, tile_counts
+
+
+def _select_activity_counts():
+    # Деятельности без организаций в таблице счетчиков отсутствуют
+    counts = activity_organization_counts.c
+    return select(Activity.id.label("activity_id"), func.coalesce(counts.organizations, 0).label("organizations")) \
+        .outerjoin(activity_organization_counts, counts.activity_id == Activity.id)
+
+
+async def get_activity_counts(db: AsyncSession):
+    return (await db.execute(_select_activity_counts().order_by(Activity.id))).all()
+
+
+async def get_activity_count(activity_id: int, db: AsyncSession):
+    found = (await db.execute(_select_activity_counts().where(Activity.id == activity_id))).first()
+    if found is None:
+        raise HTTPException(status_code=404, detail="Activity not found")
+    return found
+
+
+async def get_tile_counts(zoom: int, db: AsyncSession,
+                          min_lat: Optional[float] = None, max_lat: Optional[float] = None,
+                          min_lon: Optional[float] = None, max_lon: Optional[float] = None):
+    bbox = (min_lat, max_lat, min_lon, max_lon)
+    if any(value is not None for value in bbox) and not all(value is not None for value in bbox):
+        raise HTTPException(status_code=400, detail="min_lat, max_lat, min_lon and max_lon must be given together")
+    columns = tile_counts.c
+    statement = select(tile_counts).where(columns.zoom == zoom).order_by(columns.x, columns.y)
+    if min_lat is not None:
+        # Номера тайлов растут к востоку и к югу; прямоугольник через 180-й меридиан дает два диапазона x
+        min_x, max_y = tile(min_lat, min_lon, zoom)
+        max_x, min_y = tile(max_lat, max_lon, zoom)
+        statement = statement.where(columns.y.between(min_y, max_y))
+        if min_lon <= max_lon:
+            statement = statement.where(columns.x.between(min_x, max_x))
+        else:
+            statement = statement.where(or_(columns.x >= min_x, columns.x <= max_x))
+    return (await db.execute(statement)).all()
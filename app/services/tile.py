@@ -0,0 +1,74 @@
+from fastapi import HTTPException
+from sqlalchemy import and_, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.aggregates import TILE_MAX_ZOOM
+from app.geo import tile_bounds
+from app.models import Building, Organization, building_tiles, tile_counts
+from app.read_model import BUILDING_COLUMNS
+
+# Самый подробный уровень, который отдает API; уровни выше TILE_MAX_ZOOM всегда отдаются отдельными зданиями
+MAX_TILE_ZOOM = 22
+# Кластеры — непустые тайлы на TILE_CLUSTER_DEPTH уровней подробнее запрошенного: не больше 8 x 8 на тайл
+TILE_CLUSTER_DEPTH = 3
+# Если зданий в тайле не больше TILE_POINT_LIMIT, они отдаются по отдельности вместо кластеров
+TILE_POINT_LIMIT = 256
+
+
+async def get_tile(zoom: int, x: int, y: int, db: AsyncSession):
+    n = 1 << zoom
+    if x >= n or y >= n:
+        raise HTTPException(status_code=400, detail="x and y must be less than 2 ** zoom")
+    result = {"zoom": zoom, "x": x, "y": y, "clusters": [], "buildings": []}
+    if zoom <= TILE_MAX_ZOOM:
+        # Число зданий в тайле — по первичному ключу из building_tiles, без обхода buildings
+        columns = building_tiles.c
+        count = (await db.execute(
+            select(columns.buildings).where(columns.zoom == zoom, columns.x == x, columns.y == y)
+        )).scalar()
+        if not count:
+            return result
+        if count > TILE_POINT_LIMIT:
+            result["clusters"] = await _clusters(zoom, x, y, db)
+            return result
+    result["buildings"] = await _buildings(zoom, x, y, db)
+    return result
+
+
+async def _clusters(zoom: int, x: int, y: int, db: AsyncSession):
+    level = min(zoom + TILE_CLUSTER_DEPTH, TILE_MAX_ZOOM)
+    shift = level - zoom
+    buildings, organizations = building_tiles.c, tile_counts.c
+    statement = select(
+        (buildings.latitude_sum / buildings.buildings).label("latitude"),
+        (buildings.longitude_sum / buildings.buildings).label("longitude"),
+        buildings.buildings,
+        func.coalesce(organizations.organizations, 0).label("organizations"),
+    ).outerjoin(tile_counts, and_(organizations.zoom == buildings.zoom, organizations.x == buildings.x,
+                                  organizations.y == buildings.y)) \
+        .where(buildings.zoom == level,
+               buildings.x.between(x << shift, ((x + 1) << shift) - 1),
+               buildings.y.between(y << shift, ((y + 1) << shift) - 1)) \
+        .order_by(buildings.x, buildings.y)
+    return (await db.execute(statement)).all()
+
+
+async def _buildings(zoom: int, x: int, y: int, db: AsyncSession):
+    n = 1 << zoom
+    min_lat, max_lat, min_lon, max_lon = tile_bounds(x, y, zoom)
+    # Северная и западная границы входят в тайл; крайние тайлы включают точки за пределами проекции
+    # и на 180-м меридиане (см. app.geo.tile)
+    conditions = [Building.longitude >= min_lon]
+    if x < n - 1:
+        conditions.append(Building.longitude < max_lon)
+    if y > 0:
+        conditions.append(Building.latitude <= max_lat)
+    if y < n - 1:
+        conditions.append(Building.latitude > min_lat)
+    statement = select(*BUILDING_COLUMNS, func.count(Organization.id).label("organizations")) \
+        .outerjoin(Organization, Organization.building_id == Building.id) \
+        .where(*conditions) \
+        .group_by(Building.id) \
+        .order_by(Building.id) \
+        .limit(TILE_POINT_LIMIT)
+    return (await db.execute(statement)).all()
@@ -0,0 +1,129 @@
+import asyncio
+import math
+import time
+from typing import Iterable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import config
+from app.cache_versions import get_version
+from app.geo import bounding_box, within_radius
+from app.models import Building
+from app.response_cache import BUILDINGS
+
+
+class BuildingGrid:
+    """
+    Равномерная сетка по координатам зданий в памяти процесса.
+
+    Загружается лениво и перестраивается целиком, когда меняется версия зданий в таблице cache_versions
+    (сверяется не чаще раза в check_interval секунд). Свои записи воркер применяет точечно через update,
+    не дожидаясь перестройки. Если под запрос попадает больше max_ids зданий, методы возвращают None,
+    и вызывающий код фильтрует по координатам в SQL вместо длинного списка IN (...).
+    """
+
+    def __init__(self, cell_size: float, check_interval: float, max_ids: int):
+        self.cell_size = cell_size
+        self.check_interval = check_interval
+        self.max_ids = max_ids
+        self._lock = asyncio.Lock()
+        self._cells: dict[tuple[int, int], dict[int, tuple[float, float]]] = {}
+        self._points: dict[int, tuple[float, float]] = {}
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+
+    def _cell(self, lat: float, lon: float) -> tuple[int, int]:
+        return math.floor(lat / self.cell_size), math.floor(lon / self.cell_size)
+
+    async def _ensure_loaded(self, db: AsyncSession):
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < self.check_interval:
+            return
+        # Версия читается до координат: запись, закоммиченная между двумя запросами, поднимет версию,
+        # и индекс перестроится при следующей сверке
+        version = await get_version(db, BUILDINGS)
+        if self._version != version:
+            async with self._lock:
+                # Пока ждали блокировку, индекс мог загрузить параллельный запрос
+                if self._version != version:
+                    rows = (await db.execute(select(Building.id, Building.latitude, Building.longitude))).all()
+                    self._cells, self._points = {}, {}
+                    for row in rows:
+                        self._insert(row.id, row.latitude, row.longitude)
+                    self._version = version
+        self._checked_at = now
+
+    def _insert(self, building_id: int, lat: float, lon: float):
+        self._points[building_id] = (lat, lon)
+        self._cells.setdefault(self._cell(lat, lon), {})[building_id] = (lat, lon)
+
+    def _remove(self, building_id: int):
+        point = self._points.pop(building_id, None)
+        if point is None:
+            return
+        cell = self._cell(*point)
+        self._cells[cell].pop(building_id, None)
+        if not self._cells[cell]:
+            del self._cells[cell]
+
+    def update(self, version: int, added: Iterable[tuple[int, float, float]] = (), removed: Iterable[int] = ()):
+        """
+        Применяет запись этого воркера, поднявшую версию зданий до version. Если индекс не загружен
+        или между загрузкой и записью были другие изменения, ничего не делает: они подхватятся перестройкой.
+        """
+        if self._version is None or self._version != version - 1:
+            return
+        for building_id in removed:
+            self._remove(building_id)
+        for building_id, lat, lon in added:
+            self._remove(building_id)
+            self._insert(building_id, lat, lon)
+        self._version = version
+
+    def invalidate(self):
+        self._version = None
+
+    def _lon_ranges(self, min_lon: float, max_lon: float) -> list[tuple[float, float]]:
+        if min_lon <= max_lon:
+            return [(min_lon, max_lon)]
+        return [(min_lon, 180.0), (-180.0, max_lon)]
+
+    def _points_in_bbox(self, min_lat: float, max_lat: float, min_lon: float, max_lon: float):
+        lon_ranges = self._lon_ranges(min_lon, max_lon)
+        min_row, max_row = self._cell(min_lat, 0)[0], self._cell(max_lat, 0)[0]
+        columns = [(self._cell(0, lo)[1], self._cell(0, hi)[1]) for lo, hi in lon_ranges]
+        cells_in_box = (max_row - min_row + 1) * sum(hi - lo + 1 for lo, hi in columns)
+        if cells_in_box > len(self._cells):
+            cells = [c for c in self._cells.items()
+                     if min_row <= c[0][0] <= max_row and any(lo <= c[0][1] <= hi for lo, hi in columns)]
+        else:
+            cells = [(key, self._cells[key]) for key in
+                     ((row, col) for row in range(min_row, max_row + 1)
+                      for lo, hi in columns for col in range(lo, hi + 1))
+                     if key in self._cells]
+        return [(building_id, (lat, lon)) for _, cell in cells for building_id, (lat, lon) in cell.items()
+                if min_lat <= lat <= max_lat and any(lo <= lon <= hi for lo, hi in lon_ranges)]
+
+    async def ids_in_bbox(self, min_lat: float, max_lat: float, min_lon: float, max_lon: float,
+                          db: AsyncSession) -> Optional[list[int]]:
+        await self._ensure_loaded(db)
+        points = self._points_in_bbox(min_lat, max_lat, min_lon, max_lon)
+        if len(points) > self.max_ids:
+            return None
+        return [building_id for building_id, _ in points]
+
+    async def distances_in_radius(self, lat: float, lon: float, radius: float,
+                                  db: AsyncSession) -> Optional[dict[int, float]]:
+        await self._ensure_loaded(db)
+        candidates = self._points_in_bbox(*bounding_box(lat, lon, radius))
+        distances = within_radius(lat, lon, ((building_id, p_lat, p_lon)
+                                             for building_id, (p_lat, p_lon) in candidates), radius)
+        if len(distances) > self.max_ids:
+            return None
+        return distances
+
+
+building_index = BuildingGrid(cell_size=config.SPATIAL_INDEX_CELL_SIZE,
+                              check_interval=config.SPATIAL_INDEX_CHECK_INTERVAL,
+                              max_ids=config.SPATIAL_INDEX_MAX_IDS)
@@ -0,0 +1,85 @@
+"""
+Скорость сериализации ответов без базы и сети: строк в секунду для страницы организаций.
+
+Сравнивается путь FastAPI (проверка response_model, dict, json.dumps) с app.serialization
+(одна проверка и JSON/MessagePack сразу из pydantic-core) для ORM-объектов и строк app.read_model.
+
+    python -m benchmarks.serialization --rows 1000
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from app import serialization
+from app.dto.organization import Organization as OrganizationDTO
+from app.dto.pagination import Page
+from app.models import Activity, Building, Organization
+from app.read_model import ActivityRow, BuildingRow, OrganizationRow
+from benchmarks.generate import activities, buildings, organizations
+
+
+def _orm_page(rows: int, seed: int) -> dict:
+    """Страница из несвязанных с сессией ORM-объектов: те же атрибуты, что после загрузки из базы."""
+    rng = random.Random(seed)
+    building_rows = [Building(id=i, **row) for i, row in enumerate(buildings(max(1, rows // 10), rng), start=1)]
+    activity_rows = [Activity(**row) for row in activities()]
+    items = []
+    for row in organizations(rows, len(building_rows), rng):
+        org = Organization(**row)
+        org.building = building_rows[row["building_id"] - 1]
+        org.activities = rng.sample(activity_rows, rng.randint(1, 3))
+        items.append(org)
+    return {"items": items, "next_cursor": None}
+
+
+def _row_page(rows: int, seed: int) -> dict:
+    """Та же страница из строк app.read_model."""
+    rng = random.Random(seed)
+    building_rows = [BuildingRow(i, **row) for i, row in enumerate(buildings(max(1, rows // 10), rng), start=1)]
+    activity_rows = [ActivityRow(**row) for row in activities()]
+    items = [OrganizationRow(row["id"], row["name"], row["phone_numbers"], building_rows[row["building_id"] - 1],
+                             rng.sample(activity_rows, rng.randint(1, 3)))
+             for row in organizations(rows, len(building_rows), rng)]
+    return {"items": items, "next_cursor": None}
+
+
+async def _fastapi(field, page) -> bytes:
+    return JSONResponse(await serialize_response(field=field, response_content=page)).body
+
+
+def _measure(name: str, rows: int, repeat: int, fn):
+    fn()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        size = len(fn())
+    elapsed = (time.perf_counter() - started) / repeat
+    print(f"{name:<24}{rows / elapsed:>12.0f} rows/s{elapsed * 1000:>9.1f} ms{size / 1024:>9.0f} KiB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.serialization",
+                                     description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000, help="организаций на странице")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    field = create_model_field(name="Response", type_=Page[OrganizationDTO], mode="serialization")
+    loop = asyncio.new_event_loop()
+    for source, page in (("orm", _orm_page(args.rows, args.seed)), ("rows", _row_page(args.rows, args.seed))):
+        _measure(f"{source}: fastapi", args.rows, args.repeat, lambda: loop.run_until_complete(_fastapi(field, page)))
+        _measure(f"{source}: json", args.rows, args.repeat,
+                 lambda: serialization.render(Page[OrganizationDTO], page))
+        if serialization.msgpack is not None:
+            _measure(f"{source}: msgpack", args.rows, args.repeat,
+                     lambda: serialization.render(Page[OrganizationDTO], page, serialization.MSGPACK))
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Общие фикстуры тестов: приложение работает с временной базой SQLite (aiosqlite),
+схема создается по моделям, данные наполняются синхронной сессией.
+"""
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app import aggregates, config, database
+from app.activity_cache import activity_cache
+from app.main import app
+from app.models import Base
+from app.response_cache import MemoryBackend, response_cache
+from app.spatial_index import building_index
+
+# Замыкание дерева деятельностей по уже вставленным activities
+CLOSURE_REBUILD = """
+    INSERT INTO activity_closure (ancestor_id, descendant_id, depth)
+    WITH RECURSIVE tree(ancestor_id, descendant_id, depth) AS (
+        SELECT id, id, 0 FROM activities
+        UNION ALL
+        SELECT tree.ancestor_id, activities.id, tree.depth + 1
+        FROM tree JOIN activities ON activities.parent_id = tree.descendant_id
+    )
+    SELECT ancestor_id, descendant_id, depth FROM tree
+"""
+
+
+@pytest.fixture
+def database_path(tmp_path):
+    return tmp_path / "test.db"
+
+
+@pytest.fixture
+def sync_engine(database_path):
+    engine = create_engine(f"sqlite:///{database_path}")
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def async_engine(database_path, sync_engine):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{database_path}", poolclass=NullPool)
+    yield engine
+    asyncio.run(engine.dispose())
+
+
+@pytest.fixture
+def session(sync_engine):
+    with sessionmaker(bind=sync_engine, autoflush=False)() as session:
+        yield session
+
+
+def finish_seed(session):
+    """Достраивает замыкание дерева деятельностей и таблицы счетчиков после наполнения базы."""
+    session.execute(text("DELETE FROM activity_closure"))
+    session.execute(text(CLOSURE_REBUILD))
+    aggregates.rebuild(session.connection())
+    session.commit()
+
+
+@pytest.fixture
+def client(async_engine, monkeypatch):
+    # Подменяются фабрики сессий, а не зависимости: выгрузка открывает сессию сама (read_sessionmaker)
+    sessions = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    monkeypatch.setattr(database, "AsyncSessionLocal", sessions)
+    monkeypatch.setattr(database, "ReadSessionLocal", sessions)
+    # Кэши процесса переживают тесты, а база у каждого теста своя
+    activity_cache.invalidate()
+    building_index.invalidate()
+    monkeypatch.setattr(response_cache, "backend",
+                        MemoryBackend(config.RESPONSE_CACHE_MAX_ENTRIES, config.RESPONSE_CACHE_TTL))
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def count_statements(async_engine):
+    """Возвращает функцию, которая выполняет запрос к API и считает отправленные в базу SQL-команды."""
+    def count(call):
+        statements = []
+
+        def listener(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(async_engine.sync_engine, "before_cursor_execute", listener)
+        try:
+            response = call()
+        finally:
+            event.remove(async_engine.sync_engine, "before_cursor_execute", listener)
+        assert response.status_code == 200, response.text
+        return len(statements)
+
+    return count
@@ -0,0 +1,70 @@
+"""
+Счетчики, которые записи через API меняют на месте (app.aggregates), совпадают с полным пересчетом
+aggregates.rebuild по тем же данным.
+"""
+import pytest
+from sqlalchemy import select
+
+from app import aggregates
+from app.models import Activity, Building, Organization, activity_organization_counts, building_tiles, tile_counts
+from tests.conftest import finish_seed
+
+
+@pytest.fixture
+def organizations(session):
+    # Еда -> Мясо -> Колбасы, Еда -> Молоко
+    activities = [Activity(id=1, name="Еда"), Activity(id=2, name="Мясо", parent_id=1),
+                  Activity(id=3, name="Колбасы", parent_id=2), Activity(id=4, name="Молоко", parent_id=1)]
+    session.add_all(activities + [
+        Building(id=1, address="Москва, Ленина 1", latitude=55.7558, longitude=37.6176),
+        Building(id=2, address="Москва, Блюхера 32/1", latitude=55.7600, longitude=37.6200),
+        Building(id=3, address="Санкт-Петербург, Невский 1", latitude=59.9343, longitude=30.3351)])
+    session.flush()
+    for organization_id, building_id, activity_ids in ((1, 1, [2]), (2, 1, [3]), (3, 2, [4, 3])):
+        session.add(Organization(id=organization_id, name=f"ООО Рога и Копыта {organization_id}",
+                                 phone_numbers="2-222-222", building_id=building_id,
+                                 activities=[activities[activity_id - 1] for activity_id in activity_ids]))
+    session.commit()
+    finish_seed(session)
+
+
+def counters(session) -> dict[str, list[tuple]]:
+    # Суммы координат накапливаются сложением и вычитанием, поэтому сравниваются с округлением
+    return {
+        "activity_organization_counts": sorted(session.execute(select(activity_organization_counts)).tuples()),
+        "tile_counts": sorted(session.execute(select(tile_counts)).tuples()),
+        "building_tiles": sorted((zoom, x, y, buildings, round(latitude_sum, 9), round(longitude_sum, 9))
+                                 for zoom, x, y, buildings, latitude_sum, longitude_sum
+                                 in session.execute(select(building_tiles)).tuples()),
+    }
+
+
+def test_counters_match_rebuild_after_writes(organizations, client, session):
+    def ok(response):
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    building_id = ok(client.post("/buildings/", json={"address": "Казань, Баумана 1",
+                                                      "latitude": 55.7887, "longitude": 49.1221}))["id"]
+    ok(client.post("/organizations/", json={"name": "ООО Казань", "phone_numbers": "3-333-333",
+                                            "building_id": building_id, "activity_ids": [3, 4]}))
+    result = ok(client.post("/organizations/bulk", json=[
+        {"name": "ООО Пачка 1", "building_id": 2, "activity_ids": [2]},
+        {"name": "ООО Пачка 2", "building_id": building_id, "activity_ids": [1, 3, 3]},
+        {"name": "ООО Без здания", "building_id": 999, "activity_ids": [1]},
+    ]))
+    assert len(result["errors"]) == 1
+    # Перенос здания 2 вместе с организациями в другой тайл и новое здание той же пачкой
+    ok(client.post("/buildings/bulk", json=[
+        {"address": "Москва, Блюхера 32/1", "latitude": 55.8000, "longitude": 37.5000},
+        {"address": "Москва, Тверская 7", "latitude": 55.7570, "longitude": 37.6130},
+    ]))
+    ok(client.delete("/organizations/1"))
+    # Колбасы поднимаются под Еду, Мясо теряет организации
+    ok(client.delete("/activities/2"))
+    ok(client.delete("/buildings/3"))
+
+    incremental = counters(session)
+    assert all(incremental.values())
+    aggregates.rebuild(session.connection())
+    assert incremental == counters(session)
@@ -0,0 +1,37 @@
+"""Поиск зданий и организаций в радиусе: с сеткой в памяти и без нее результат одинаковый."""
+import pytest
+
+from app import config
+from app.models import Activity, Building, Organization
+from tests.conftest import finish_seed
+
+RADIUS = 4.99
+
+
+@pytest.fixture
+def buildings(session):
+    # По гаверсинусу от (0, 0): 4.98 км, 4.9927 км и 5 км; по меридиану у экватора геодезическое
+    # расстояние до второго здания меньше радиуса (около 4.965 км), поэтому оно и проверяет единое правило
+    activity = Activity(id=1, name="Еда")
+    session.add_all([activity,
+                     Building(id=1, address="Экватор, 4.98", latitude=0.044786154113482, longitude=0.0),
+                     Building(id=2, address="Экватор, 4.9927", latitude=0.044900367799675, longitude=0.0),
+                     Building(id=3, address="Экватор, 5", latitude=0.044966018186227, longitude=0.0)])
+    session.flush()
+    for building_id in (1, 2, 3):
+        session.add(Organization(id=building_id, name=f"ООО Рога и Копыта {building_id}",
+                                 phone_numbers="2-222-222", building_id=building_id, activities=[activity]))
+    session.commit()
+    finish_seed(session)
+
+
+@pytest.mark.parametrize("spatial_index", [False, True])
+@pytest.mark.parametrize("path", ["/buildings/by-area", "/organizations/by-area"])
+def test_radius_does_not_depend_on_spatial_index(buildings, client, monkeypatch, spatial_index, path):
+    monkeypatch.setattr(config, "SPATIAL_INDEX_ENABLED", spatial_index)
+    response = client.get(path, params={"lat": 0, "lon": 0, "radius": RADIUS, "order_by_distance": True})
+    assert response.status_code == 200, response.text
+    items = response.json()["items"]
+    assert [item["id"] for item in items] == [1]
+    assert items[0]["distance"] == pytest.approx(4.98)
+    assert all(item["distance"] <= RADIUS for item in items)
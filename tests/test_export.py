@@ -0,0 +1,70 @@
+"""Выгрузка организаций после удаления зданий."""
+import json
+
+import pytest
+from sqlalchemy import text
+
+from app.models import Activity, Building, Organization
+from tests.conftest import finish_seed
+
+
+@pytest.fixture
+def organizations(session):
+    activity = Activity(id=1, name="Еда")
+    session.add_all([activity,
+                     Building(id=1, address="Москва, Ленина 1", latitude=55.7558, longitude=37.6176),
+                     Building(id=2, address="Москва, Блюхера 32/1", latitude=55.7600, longitude=37.6200),
+                     Building(id=3, address="Москва, Тверская 7", latitude=55.7570, longitude=37.6130)])
+    session.flush()
+    for organization_id, building_id in ((1, 1), (2, 1), (3, 2)):
+        session.add(Organization(id=organization_id, name=f"ООО Рога и Копыта {organization_id}",
+                                 phone_numbers="2-222-222", building_id=building_id, activities=[activity]))
+    session.commit()
+    finish_seed(session)
+
+
+def export(client, fmt):
+    response = client.get("/organizations/export", params={"format": fmt})
+    assert response.status_code == 200, response.text
+    if fmt == "json":
+        return json.loads(response.text)
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_building_with_organizations_is_not_deleted(organizations, client):
+    response = client.delete("/buildings/1")
+    assert response.status_code == 409
+    assert client.get("/buildings/1").status_code == 200
+    assert [org["id"] for org in export(client, "ndjson")] == [1, 2, 3]
+
+
+@pytest.mark.parametrize("fmt", ["ndjson", "json"])
+def test_export_after_building_delete(organizations, client, fmt):
+    assert client.delete("/buildings/3").status_code == 200
+    # Здание с организациями удаляется после того, как удалены они сами
+    assert client.delete("/organizations/3").status_code == 200
+    assert client.delete("/buildings/2").status_code == 200
+
+    exported = export(client, fmt)
+    assert [org["id"] for org in exported] == [1, 2]
+    assert all(org["building"]["id"] == 1 for org in exported)
+
+
+@pytest.mark.parametrize("fmt", ["ndjson", "json"])
+def test_export_skips_organizations_without_building(organizations, client, session, fmt):
+    # Такие строки могли остаться от удаления зданий до запрета (building_id обнулялся)
+    session.execute(text("UPDATE organizations SET building_id = NULL WHERE id = 2"))
+    session.commit()
+
+    assert [org["id"] for org in export(client, fmt)] == [1, 3]
+    assert [org["id"] for org in client.get("/organizations/").json()["items"]] == [1, 3]
+
+    # Постранично: организация без здания не должна обрывать пагинацию раньше последней страницы
+    ids, params = [], {"limit": 1}
+    while True:
+        page = client.get("/organizations/", params=params).json()
+        ids += [org["id"] for org in page["items"]]
+        if page["next_cursor"] is None:
+            break
+        params["after"] = page["next_cursor"]
+    assert ids == [1, 3]
@@ -0,0 +1,53 @@
+"""
+Число SQL-команд на запрос списка организаций не зависит от размера страницы:
+здание и деятельности загружаются вместе со страницей, без запроса на каждую организацию.
+"""
+import pytest
+
+from app import config
+from app.models import Activity, Building, Organization
+from tests.conftest import finish_seed
+
+ORGANIZATIONS = 30
+PAGE_SIZES = (2, 10)
+
+
+@pytest.fixture
+def organizations(session):
+    activities = [Activity(id=1, name="Еда"), Activity(id=2, name="Мясо", parent_id=1),
+                  Activity(id=3, name="Молоко", parent_id=1)]
+    buildings = [Building(id=1, address="Москва, Ленина 1", latitude=55.7558, longitude=37.6176),
+                 Building(id=2, address="Москва, Блюхера 32/1", latitude=55.7600, longitude=37.6200)]
+    session.add_all(activities + buildings)
+    session.flush()
+    for organization_id in range(1, ORGANIZATIONS + 1):
+        organization = Organization(id=organization_id, name=f"ООО Рога и Копыта {organization_id}",
+                                    phone_numbers="2-222-222", building_id=1 + organization_id % 2)
+        organization.activities.extend([activities[0], activities[1 + organization_id % 2]])
+        session.add(organization)
+    session.commit()
+    finish_seed(session)
+
+
+@pytest.fixture(autouse=True)
+def no_response_cache(monkeypatch):
+    # Считаем запросы самого сервиса, а не попадания в кэш ответов
+    monkeypatch.setattr(config, "RESPONSE_CACHE_ENABLED", False)
+
+
+@pytest.mark.parametrize("path", ["/organizations/", "/organizations/by-building/2", "/organizations/by-activity/1"])
+def test_statements_do_not_depend_on_page_size(organizations, client, count_statements, path):
+    counts = []
+    for limit in PAGE_SIZES:
+        counts.append(count_statements(lambda: client.get(path, params={"limit": limit})))
+        page = client.get(path, params={"limit": limit}).json()
+        assert len(page["items"]) == limit
+        assert all(item["building"]["id"] and item["activities"] for item in page["items"])
+    assert counts == [1, 1]
+
+
+@pytest.mark.parametrize("activity_id", [1, 2])
+def test_activity_delete_fits_query_budget(organizations, client, count_statements, activity_id):
+    # Удаление корня с потомками и листа со связями организаций укладывается в бюджет, иначе каждое
+    # обычное удаление деятельности давало бы предупреждение об N+1
+    assert count_statements(lambda: client.delete(f"/activities/{activity_id}")) <= config.QUERY_BUDGET
@@ -0,0 +1,66 @@
+"""Чтение с реплики и read-your-writes: вместо основной базы и реплики — два файла SQLite."""
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app import config, database
+from app.models import Base, Building
+from tests.conftest import finish_seed
+
+
+def seed(session, address):
+    session.add(Building(id=1, address=address, latitude=55.7558, longitude=37.6176))
+    session.commit()
+    finish_seed(session)
+
+
+@pytest.fixture
+def replica(tmp_path, session, client, monkeypatch):
+    # Основная база — фикстура session; реплика отстает и знает здание 1 под старым адресом
+    seed(session, "Москва, Ленина 1")
+    engine = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    Base.metadata.create_all(engine)
+    with sessionmaker(bind=engine)() as replica_session:
+        seed(replica_session, "Москва, Ленина 1 (реплика)")
+    engine.dispose()
+
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}", poolclass=NullPool)
+    monkeypatch.setattr(database, "ReadSessionLocal",
+                        async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False))
+    monkeypatch.setattr(config, "RESPONSE_CACHE_ENABLED", False)
+    yield
+    asyncio.run(async_engine.dispose())
+
+
+def addresses(client):
+    response = client.get("/buildings/")
+    assert response.status_code == 200, response.text
+    return [building["address"] for building in response.json()["items"]]
+
+
+def test_reads_go_to_replica_until_a_write(replica, client):
+    assert addresses(client) == ["Москва, Ленина 1 (реплика)"]
+
+    # Отклоненные записи ничего не меняют и не переключают чтение на основную базу
+    assert client.delete("/buildings/999").status_code == 404
+    assert client.post("/organizations/", json={"name": "ООО", "building_id": 999, "activity_ids": []}) \
+        .status_code == 404
+    assert client.post("/buildings/", json={"address": "Москва"}).status_code == 422
+    response = client.post("/organizations/bulk", json=[{"name": "ООО", "building_id": 999, "activity_ids": []}])
+    assert response.status_code == 200 and response.json()["ids"] == [None]
+    assert database.PRIMARY_COOKIE not in client.cookies
+    assert addresses(client) == ["Москва, Ленина 1 (реплика)"]
+
+    response = client.post("/buildings/", json={"address": "Москва, Тверская 7", "latitude": 55.757,
+                                                "longitude": 37.613})
+    assert response.status_code == 200, response.text
+    assert database.PRIMARY_COOKIE in response.cookies
+    # Запись ушла в основную базу, и следующее чтение клиента идет туда же
+    assert addresses(client) == ["Москва, Ленина 1", "Москва, Тверская 7"]
+
+    client.cookies.clear()
+    assert addresses(client) == ["Москва, Ленина 1 (реплика)"]
@@ -0,0 +1,30 @@
+"""ETag кэшированных ответов при сжатии."""
+import pytest
+
+from app.models import Building
+from tests.conftest import finish_seed
+
+
+@pytest.fixture
+def buildings(session):
+    # Ответ со всеми зданиями больше RESPONSE_COMPRESSION_MIN_SIZE и сжимается
+    session.add_all([Building(id=building_id, address=f"Москва, Ленина {building_id}",
+                              latitude=55.75 + building_id / 1000, longitude=37.61) for building_id in range(1, 41)])
+    session.commit()
+    finish_seed(session)
+
+
+def test_etag_is_weak_for_every_content_encoding(buildings, client):
+    etags = {}
+    for encoding in ("identity", "gzip"):
+        response = client.get("/buildings/", headers={"Accept-Encoding": encoding})
+        assert response.status_code == 200, response.text
+        assert response.headers.get("content-encoding", "identity") == encoding
+        etags[encoding] = response.headers["etag"]
+    # Один валидатор на разные представления допустим только слабый
+    assert etags["identity"] == etags["gzip"]
+    assert etags["gzip"].startswith('W/"')
+
+    response = client.get("/buildings/", headers={"Accept-Encoding": "gzip", "If-None-Match": etags["gzip"]})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etags["gzip"]
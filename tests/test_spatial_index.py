@@ -0,0 +1,50 @@
+"""Сетка зданий в памяти (SPATIAL_INDEX_ENABLED): свои записи применяются на месте, чужие — перестройкой."""
+import pytest
+from sqlalchemy import text
+
+from app import config
+from app.models import Building
+from app.spatial_index import building_index
+from tests.conftest import finish_seed
+
+AREA = {"lat": 55.7558, "lon": 37.6176, "radius": 5}
+
+
+@pytest.fixture
+def buildings(session, monkeypatch):
+    monkeypatch.setattr(config, "SPATIAL_INDEX_ENABLED", True)
+    session.add_all([Building(id=1, address="Москва, Ленина 1", latitude=55.7558, longitude=37.6176),
+                     Building(id=2, address="Москва, Блюхера 32/1", latitude=55.7600, longitude=37.6200),
+                     Building(id=3, address="Санкт-Петербург, Невский 1", latitude=59.9343, longitude=30.3351)])
+    session.commit()
+    finish_seed(session)
+
+
+def in_area(client) -> list[int]:
+    response = client.get("/buildings/by-area", params=AREA)
+    assert response.status_code == 200, response.text
+    return sorted(building["id"] for building in response.json()["items"])
+
+
+def test_grid_follows_writes(buildings, client, session):
+    assert in_area(client) == [1, 2]
+    # Перестройка заменяет словарь ячеек целиком, точечное обновление меняет его на месте
+    cells = building_index._cells
+
+    response = client.post("/buildings/", json={"address": "Москва, Тверская 7", "latitude": 55.757,
+                                                "longitude": 37.613})
+    assert response.status_code == 200, response.text
+    created_id = response.json()["id"]
+    assert in_area(client) == [1, 2, created_id]
+    assert building_index._cells is cells
+
+    assert client.delete(f"/buildings/{created_id}").status_code == 200
+    assert in_area(client) == [1, 2]
+    assert building_index._cells is cells
+
+    # Запись в обход этого процесса (другой воркер, загрузчик): видна только по версии в cache_versions
+    session.execute(text("UPDATE buildings SET latitude = 55.7560, longitude = 37.6180 WHERE id = 3"))
+    session.execute(text("UPDATE cache_versions SET version = version + 1 WHERE name = 'buildings'"))
+    session.commit()
+    assert in_area(client) == [1, 2, 3]
+    assert building_index._cells is not cells